@@ -1,17 +1,123 @@
 from __future__ import annotations
 
+import hashlib
+import hmac
+import os
+from functools import lru_cache
 from pathlib import Path
-from flask import Flask
+
+import click
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as _FlaskSession
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class RoutingSession(_FlaskSession):
+    """db.session: reads run on the read-only "reader" bind, writes on the single writer.
+
+    A transaction moves to the writer at its first flush or INSERT/UPDATE/DELETE and stays
+    there until it ends, so it reads its own uncommitted changes. Until then it holds no
+    writer connection, so read-only requests never queue behind the writer.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self.info.get("writing"):
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info["writing"] = True
+            elif "reader" in self._db.engines:
+                return self._db.engines["reader"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _end_writing(session, transaction) -> None:
+    if transaction.parent is None:
+        session.info.pop("writing", None)
 
-db = SQLAlchemy()
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 # CSRF disabled globally for demo per user request
 csrf = None
 
 
+def hash_password(password: str) -> str:
+    """Hash a user-supplied password with the configured PASSWORD_HASH_METHOD."""
+    return generate_password_hash(password, method=current_app.config["PASSWORD_HASH_METHOD"])
+
+
+_VERIFIED_MAX = 1024
+# HMAC-SHA256 digests, under SECRET_KEY, of (stored hash, password) pairs that already
+# passed the KDF. The stored hash (with its salt) is part of the message, so a password
+# change or rehash drops out on its own, and without SECRET_KEY the digests can't be
+# tested against password guesses at all.
+_verified: set[bytes] = set()
+
+
+def verify_password(stored_hash: str, password: str) -> bool:
+    """check_password_hash, skipping the KDF for a pair that already verified in this process."""
+    key = hmac.new(
+        current_app.config["SECRET_KEY"].encode(), f"{stored_hash}\0{password}".encode(), hashlib.sha256
+    ).digest()
+    if key in _verified:
+        return True
+    if not check_password_hash(stored_hash, password):
+        return False
+    if len(_verified) >= _VERIFIED_MAX:
+        _verified.clear()
+    _verified.add(key)
+    return True
+
+
+@lru_cache(maxsize=None)
+def _hash_prefix(method: str) -> str:
+    # Werkzeug expands defaults into the stored prefix ("scrypt" -> "scrypt:32768:8:1"),
+    # so derive it from a real hash once per configured method.
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def password_needs_rehash(stored_hash: str) -> bool:
+    """True when stored_hash was made with something other than PASSWORD_HASH_METHOD."""
+    return stored_hash.split("$", 1)[0] != _hash_prefix(current_app.config["PASSWORD_HASH_METHOD"])
+
+
+def _set_sqlite_pragmas(dbapi_conn, _conn_record) -> None:
+    # WAL lets readers run alongside the single writer; NORMAL sync is durable under WAL.
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA foreign_keys=ON")
+    cur.close()
+    _set_sqlite_reader_pragmas(dbapi_conn, _conn_record)
+
+
+def _set_sqlite_reader_pragmas(dbapi_conn, _conn_record) -> None:
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-65536")  # 64 MiB page cache
+    cur.execute("PRAGMA busy_timeout=30000")
+    cur.close()
+
+
+def _begin_immediate(conn) -> None:
+    # Take the write lock when the transaction starts instead of upgrading a read lock
+    # mid-transaction, which fails with SQLITE_BUSY if another writer got there first.
+    # Only writing transactions reach the writer engine (see RoutingSession), so reads
+    # never hold this lock.
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def read_session() -> Session:
+    """Standalone session on the "reader" bind, for streaming or long reads kept off db.session."""
+    return Session(db.engines["reader"])
+
+
 def create_app() -> Flask:
     app = Flask(__name__, instance_relative_config=True)
     # Basic config
@@ -22,9 +128,52 @@ def create_app() -> Flask:
     db_path = instance_path / "ehallpass.sqlite"
     app.config.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite:///{db_path}")
     app.config.setdefault("SQLALCHEMY_TRACK_MODIFICATIONS", False)
+    # Caps request bodies (413 above it); the CSV import reads uploads into memory.
+    app.config.setdefault("MAX_CONTENT_LENGTH", 16 * 1024 * 1024)
+    # Werkzeug's default (scrypt) unless overridden; seed data uses a cheaper method in debug.
+    app.config.setdefault("PASSWORD_HASH_METHOD", os.environ.get("PASSWORD_HASH_METHOD", "scrypt"))
+    # Off by default (the demo login form posts without CSRF); set LOGIN_CSRF_STRICT=1 to
+    # check the token on login and reject bad ones instead of ignoring the result.
+    app.config.setdefault("LOGIN_CSRF_STRICT", os.environ.get("LOGIN_CSRF_STRICT", "0") == "1")
+    # Pass list queries raise on relationships they didn't prefetch (see list_options);
+    # unset means on under debug/testing only. RAISELOAD_GUARD=1/0 forces it either way.
+    if "RAISELOAD_GUARD" in os.environ:
+        app.config.setdefault("RAISELOAD_GUARD", os.environ["RAISELOAD_GUARD"] == "1")
+    # One writer connection (SQLite allows a single writer anyway) plus a pool of
+    # read-only connections that WAL lets run concurrently with it. RoutingSession sends
+    # db.session reads to the reader pool, so only writing transactions use this one.
+    app.config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS",
+        {
+            "pool_size": 1,
+            "max_overflow": 0,
+            # A local file can't drop the connection, so skip the per-checkout ping.
+            "pool_pre_ping": False,
+            "query_cache_size": 1200,
+            # isolation_level=None stops pysqlite issuing its own deferred BEGIN; see _begin_immediate.
+            "connect_args": {"timeout": 30, "check_same_thread": False, "isolation_level": None},
+        },
+    )
+    app.config.setdefault(
+        "SQLALCHEMY_BINDS",
+        {
+            "reader": {
+                "url": f"sqlite:///file:{db_path.as_posix()}?mode=ro&uri=true",
+                "pool_size": 8,
+                "pool_pre_ping": False,
+                "query_cache_size": 1200,
+                "connect_args": {"timeout": 30, "check_same_thread": False},
+            },
+        },
+    )
 
     # Init extensions
     db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            event.listen(db.engine, "connect", _set_sqlite_pragmas)
+            event.listen(db.engine, "begin", _begin_immediate)
+            event.listen(db.engines["reader"], "connect", _set_sqlite_reader_pragmas)
     login_manager.init_app(app)
     # CSRF disabled globally for demo; do not initialize
     login_manager.login_view = "auth.login"
@@ -42,9 +191,20 @@ def create_app() -> Flask:
     app.register_blueprint(passes_bp, url_prefix="/passes")
     app.register_blueprint(kiosk_bp, url_prefix="/kiosk")
 
-    # Create DB tables if not exist (dev convenience)
+    # Creating tables on every boot makes concurrent workers fight for the write lock;
+    # run `flask init-db` once instead, or set AUTO_CREATE_ALL=1 for dev convenience.
+    app.config.setdefault("AUTO_CREATE_ALL", os.environ.get("AUTO_CREATE_ALL", "0") == "1")
     with app.app_context():
         from . import models  # noqa: F401
+        if app.config["AUTO_CREATE_ALL"]:
+            db.create_all()
+
+    @app.cli.command("init-db")
+    def init_db():
+        """Create all tables and upgrade existing ones. Safe on a live database; seeding is `manage.py seed`."""
+        from .models.schema import upgrade_schema
         db.create_all()
+        upgrade_schema()
+        click.echo("Database initialized.")
 
     return app
@@ -1,21 +1,34 @@
 from __future__ import annotations
 
+import secrets
 from datetime import datetime
-from enum import Enum
+from enum import IntEnum
+from time import monotonic
 from typing import Optional
 
+from flask import current_app, g, has_app_context
 from flask_login import UserMixin
 from sqlalchemy import (
     CheckConstraint,
     DateTime,
-    Enum as SAEnum,
     ForeignKey,
+    Index,
     Integer,
+    SmallInteger,
     String,
+    TypeDecorator,
     UniqueConstraint,
+    bindparam,
+    column,
+    event,
     func,
+    insert,
+    select,
+    text,
+    update,
 )
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Mapped, Session, joinedload, mapped_column, raiseload, relationship, validates
 from datetime import time
 
 from app import db, login_manager
@@ -38,10 +51,39 @@ class Role(db.Model):
 
     users: Mapped[list["User"]] = relationship("User", back_populates="role")
 
+    @classmethod
+    def id_for(cls, name: str) -> Optional[int]:
+        """Role id by name from the in-process cache, reloading the (tiny) table every ROLE_IDS_TTL seconds."""
+        global _ROLE_IDS
+        now = monotonic()
+        if _ROLE_IDS is None or now >= _ROLE_IDS[0]:
+            _ROLE_IDS = (now + ROLE_IDS_TTL, dict(db.session.execute(select(cls.name, cls.id)).all()))
+        return _ROLE_IDS[1].get(name)
+
+    @staticmethod
+    def invalidate_cache() -> None:
+        global _ROLE_IDS
+        _ROLE_IDS = None
+
+
+# (expires_at monotonic, name -> id); None until first read. Same invalidation rules as
+# _SETTING_CACHE, with a longer TTL since roles only change through the seeder.
+ROLE_IDS_TTL = 60.0
+_ROLE_IDS: Optional[tuple[float, dict[str, int]]] = None
+
+
+@event.listens_for(Role, "after_insert")
+@event.listens_for(Role, "after_update")
+@event.listens_for(Role, "after_delete")
+def _invalidate_role_cache(mapper, connection, target) -> None:
+    Role.invalidate_cache()
+
 
 class User(UserMixin, db.Model):
     __tablename__ = "users"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # Stored lowercased (every write and lookup lowers the input), so the plain BINARY unique
+    # index serves case-insensitive lookups and fresh and upgraded databases share one schema.
     email: Mapped[str] = mapped_column(String(255), unique=True, nullable=False, index=True)
     full_name: Mapped[str] = mapped_column(String(255), nullable=False)
     password_hash: Mapped[str] = mapped_column(String(255), nullable=True)  # nullable for SSO-only accounts
@@ -53,15 +95,35 @@ class User(UserMixin, db.Model):
     def get_id(self) -> str:
         return str(self.id)
 
+    __table_args__ = (Index("ix_users_active_role", "is_active_flag", "role_id"),)
+
     # Flask-Login's UserMixin.is_active is typed as always True; keep compatibility by returning True for active users.
-    @property
+    # As a hybrid it also works in queries: User.query.filter(User.is_active) filters in SQL.
+    @hybrid_property
     def is_active(self):  # type: ignore[override]
         return bool(self.is_active_flag)
 
+    @is_active.inplace.expression
+    @classmethod
+    def _is_active_expression(cls):
+        return cls.is_active_flag == 1
+
+
+# Built once: load_user runs on every authenticated request, so reuse one statement
+# (and its compiled-cache entry) rather than assembling a new one each time.
+_LOAD_USER = select(User).options(joinedload(User.role)).where(User.id == bindparam("uid"))
+
 
 @login_manager.user_loader
 def load_user(user_id: str) -> Optional["User"]:
-    return db.session.get(User, int(user_id))
+    # Memoize per request on flask.g; the role is joined in since nearly every view checks it.
+    uid = int(user_id)
+    if not has_app_context():
+        return db.session.execute(_LOAD_USER, {"uid": uid}).scalar_one_or_none()
+    cache = g.setdefault("_user_cache", {})
+    if uid not in cache:
+        cache[uid] = db.session.execute(_LOAD_USER, {"uid": uid}).scalar_one_or_none()
+    return cache[uid]
 
 
 class Destination(db.Model):
@@ -72,6 +134,33 @@ class Destination(db.Model):
     max_concurrent: Mapped[int] = mapped_column(Integer, nullable=False, default=-1)  # -1 = unlimited
 
 
+def hhmm_to_minutes(value: Optional[str]) -> Optional[int]:
+    """Parse "HH:MM" into minutes since midnight; None if unset or malformed."""
+    if not value:
+        return None
+    try:
+        h, m = [int(x) for x in value.split(":")]
+    except ValueError:
+        return None
+    return h * 60 + m
+
+
+DAYS_MASK_ALL = 0x7F
+
+
+def parse_days_mask(value: Optional[str]) -> Optional[int]:
+    """Parse a "1111100" (Mon..Sun) string into a bitmask; None (every day) if unset or malformed."""
+    if not value or len(value) != 7 or set(value) - {"0", "1"}:
+        return None
+    return sum(1 << i for i, c in enumerate(value) if c == "1")
+
+
+def format_days_mask(mask: Optional[int]) -> Optional[str]:
+    if mask is None:
+        return None
+    return "".join("1" if (mask >> i) & 1 else "0" for i in range(7))
+
+
 class ClassPeriod(db.Model):
     __tablename__ = "class_periods"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -80,8 +169,11 @@ class ClassPeriod(db.Model):
     # store times as "HH:MM" strings (24h) for simplicity with SQLite, keep 5NF in separate attributes
     start_time: Mapped[str] = mapped_column(String(5), nullable=True)  # e.g., "08:30"
     end_time: Mapped[str] = mapped_column(String(5), nullable=True)    # e.g., "09:20"
-    # days_mask like "1111100" for Mon..Sun; optional for schools that don't need it
-    days_mask: Mapped[str] = mapped_column(String(7), nullable=True)
+    # days_mask bit i set = weekday i (Mon=0..Sun=6) enabled; NULL = every day
+    days_mask: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
+    # minutes since midnight, derived from start_time/end_time on write (see _sync_minutes)
+    start_minutes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    end_minutes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     # optional info
     room: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
     is_active: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
@@ -91,25 +183,34 @@ class ClassPeriod(db.Model):
         "StudentEnrollment", back_populates="class_period", cascade="all, delete-orphan"
     )
 
-    __table_args__ = (UniqueConstraint("name", "teacher_id", name="uq_classperiod_name_teacher"),)
+    __table_args__ = (
+        UniqueConstraint("name", "teacher_id", name="uq_classperiod_name_teacher"),
+        Index("ix_class_periods_teacher", "teacher_id", "is_active"),  # a teacher's own periods
+    )
+
+    @validates("start_time", "end_time")
+    def _sync_minutes(self, key: str, value: Optional[str]) -> Optional[str]:
+        if key == "start_time":
+            self.start_minutes = hhmm_to_minutes(value)
+        else:
+            self.end_minutes = hhmm_to_minutes(value)
+        return value
 
     def is_now_in_window(self, now: datetime) -> bool:
-        if not self.start_time or not self.end_time:
-            return True
-        try:
-            sh, sm = [int(x) for x in self.start_time.split(":")]
-            eh, em = [int(x) for x in self.end_time.split(":")]
-            start_minutes = sh * 60 + sm
-            end_minutes = eh * 60 + em
-            now_minutes = now.hour * 60 + now.minute
-            in_time = start_minutes <= now_minutes <= end_minutes
-            if self.days_mask and len(self.days_mask) == 7:
-                # Python Monday=0 .. Sunday=6
-                idx = now.weekday()
-                return in_time and self.days_mask[idx] == "1"
-            return in_time
-        except Exception:
+        # Unset or unparseable times mean "no window"
+        if self.start_minutes is None or self.end_minutes is None:
             return True
+        now_minutes = now.hour * 60 + now.minute
+        in_time = self.start_minutes <= now_minutes <= self.end_minutes
+        if self.days_mask is not None:
+            # Python Monday=0 .. Sunday=6
+            return in_time and bool((self.days_mask >> now.weekday()) & 1)
+        return in_time
+
+    @property
+    def days_mask_str(self) -> Optional[str]:
+        """days_mask in the "1111100" (Mon..Sun) form used by forms and CSV imports."""
+        return format_days_mask(self.days_mask)
 
 
 class StudentEnrollment(db.Model):
@@ -122,16 +223,38 @@ class StudentEnrollment(db.Model):
     student: Mapped["User"] = relationship("User")
     class_period: Mapped["ClassPeriod"] = relationship("ClassPeriod", back_populates="enrollments")
 
-    __table_args__ = (UniqueConstraint("student_id", "class_period_id", name="uq_enrollment_student_class"),)
+    __table_args__ = (
+        UniqueConstraint("student_id", "class_period_id", name="uq_enrollment_student_class"),
+        # rosters: the unique constraint leads with student_id, so look-ups by period need their own index
+        Index("ix_enrollments_period", "class_period_id", "is_active"),
+    )
+
+
+class PassState(IntEnum):
+    # Stored as these integers; never renumber, only append.
+    PENDING = 0
+    ACTIVE = 1
+    EXPIRED = 2
+    CANCELLED = 3
+    DENIED = 4
+    ARCHIVED = 5
+
+    @property
+    def label(self) -> str:
+        return self.name.capitalize()
+
 
+class PassStateType(TypeDecorator):
+    """PassState persisted as a SMALLINT."""
 
-class PassState(str, Enum):
-    PENDING = "Pending"
-    ACTIVE = "Active"
-    EXPIRED = "Expired"
-    CANCELLED = "Cancelled"
-    DENIED = "Denied"
-    ARCHIVED = "Archived"
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else PassState(value)
 
 
 
@@ -146,7 +269,10 @@ class Pass(db.Model):
     # Allow NULL for pending passes
     issued_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
-    state: Mapped[PassState] = mapped_column(SAEnum(PassState), nullable=False, default=PassState.PENDING)
+    state: Mapped[PassState] = mapped_column(PassStateType(), nullable=False, default=PassState.PENDING)
+    # ", "-joined names of the assigned teachers, kept in step by the PassAssignment events
+    # below so the kiosk board reads one column instead of joining assignments per row.
+    staff_names: Mapped[str] = mapped_column(String(256), nullable=False, default="", server_default="")
 
     student: Mapped["User"] = relationship("User")
     destination: Mapped["Destination"] = relationship("Destination")
@@ -159,17 +285,67 @@ class Pass(db.Model):
 
     __table_args__ = (
         CheckConstraint("(issued_at IS NULL AND expires_at IS NULL) OR (expires_at > issued_at)", name="ck_pass_time_order"),
+        # expiry sweeps and per-student "has an open pass" checks
+        Index("ix_passes_state_expires", "state", "expires_at"),
+        Index("ix_passes_student_state", "student_id", "state"),
+        # newest-first lists: kiosk board (state) and student dashboard (student_id)
+        Index("ix_passes_state_issued", "state", "issued_at"),
+        Index("ix_passes_student_issued", "student_id", "issued_at"),
+        # metrics: per-destination counts and the hourly histogram
+        Index("ix_passes_destination", "destination_id"),
+        Index("ix_passes_issued_at", "issued_at"),
     )
 
-    def remaining_seconds(self) -> int:
+    # Both helpers take an optional ``now`` so list views can read the clock once per response.
+    def remaining_seconds(self, now: Optional[datetime] = None) -> int:
         if self.state != PassState.ACTIVE or not self.expires_at:
             return 0
-        return max(0, int((self.expires_at - datetime.utcnow()).total_seconds()))
+        return max(0, int((self.expires_at - (now or datetime.utcnow())).total_seconds()))
 
-    def mark_expired_if_needed(self) -> None:
-        if self.state == PassState.ACTIVE and self.expires_at and datetime.utcnow() >= self.expires_at:
+    def mark_expired_if_needed(self, now: Optional[datetime] = None) -> None:
+        if self.state == PassState.ACTIVE and self.expires_at and (now or datetime.utcnow()) >= self.expires_at:
             self.state = PassState.EXPIRED
 
+    @classmethod
+    def active_count(cls) -> int:
+        """Number of ACTIVE passes for dashboards, recounted at most every ACTIVE_COUNT_TTL seconds."""
+        global _ACTIVE_COUNT
+        now = monotonic()
+        if _ACTIVE_COUNT is None or now >= _ACTIVE_COUNT[0]:
+            count = db.session.scalar(select(func.count()).select_from(cls).where(cls.state == PassState.ACTIVE))
+            _ACTIVE_COUNT = (now + ACTIVE_COUNT_TTL, count)
+        return _ACTIVE_COUNT[1]
+
+
+# (expires_at monotonic, count) for Pass.active_count(); the count is served off the
+# (state, expires_at) index, the TTL just keeps busy dashboards from re-running it.
+ACTIVE_COUNT_TTL = 5.0
+_ACTIVE_COUNT: Optional[tuple[float, int]] = None
+
+# Bumped on every ORM insert/update/delete of a Pass in this process; caches of
+# pass-derived data compare it to tell whether they are stale.
+_PASS_WRITES = 0
+
+
+def pass_write_count() -> int:
+    return _PASS_WRITES
+
+
+@event.listens_for(Pass, "after_insert")
+@event.listens_for(Pass, "after_update")
+@event.listens_for(Pass, "after_delete")
+def _count_pass_write(mapper, connection, target) -> None:
+    global _PASS_WRITES
+    _PASS_WRITES += 1
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _count_bulk_pass_write(orm_execute_state) -> None:
+    # ORM-enabled update()/delete() statements skip the mapper events above.
+    global _PASS_WRITES
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is Pass.__mapper__:
+        _PASS_WRITES += 1
+
 
 class PassAssignment(db.Model):
     __tablename__ = "pass_assignments"
@@ -180,7 +356,33 @@ class PassAssignment(db.Model):
     pass_: Mapped["Pass"] = relationship("Pass", back_populates="assignments")
     teacher: Mapped["User"] = relationship("User")
 
-    __table_args__ = (UniqueConstraint("pass_id", "teacher_id", name="uq_pass_teacher"),)
+    __table_args__ = (
+        UniqueConstraint("pass_id", "teacher_id", name="uq_pass_teacher"),
+        # "passes assigned to me" lookups start from the teacher side and only need pass_id,
+        # so the IN-subquery is answered from the index alone
+        Index("ix_passassign_teacher_pass", "teacher_id", "pass_id"),
+    )
+
+
+def staff_names_for(pass_id):
+    """Scalar subquery for Pass.staff_names of pass_id (a value or a correlated column)."""
+    return (
+        select(func.coalesce(func.group_concat(User.full_name, ", "), ""))
+        .select_from(PassAssignment)
+        .join(User, User.id == PassAssignment.teacher_id)
+        .where(PassAssignment.pass_id == pass_id)
+        .scalar_subquery()
+    )
+
+
+@event.listens_for(PassAssignment, "after_insert")
+@event.listens_for(PassAssignment, "after_delete")
+def _refresh_staff_names(mapper, connection, target) -> None:
+    # Recomputed in SQL within the same flush, so the stored names always match the rows.
+    passes = Pass.__table__
+    connection.execute(
+        update(passes).where(passes.c.id == target.pass_id).values(staff_names=staff_names_for(target.pass_id))
+    )
 
 
 class Override(db.Model):
@@ -191,7 +393,9 @@ class Override(db.Model):
     previous_expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     new_expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     reason: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=func.now())
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.utcnow, server_default=func.current_timestamp()
+    )
 
     pass_: Mapped["Pass"] = relationship("Pass", back_populates="overrides")
     performed_by: Mapped["User"] = relationship("User")
@@ -205,10 +409,53 @@ class LogEntry(db.Model):
     target_type: Mapped[Optional[str]] = mapped_column(String(80), nullable=True)
     target_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     message: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=func.now())
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.utcnow, server_default=func.current_timestamp()
+    )
 
     actor: Mapped[Optional["User"]] = relationship("User")
 
+    @classmethod
+    def bulk_log(
+        cls, actor_id: Optional[int], events: list[tuple[str, Optional[str], Optional[int], Optional[str]]]
+    ) -> None:
+        """Add (action, target_type, target_id, message) events as one executemany INSERT.
+
+        Runs in the current session transaction, so the rows commit with the caller's changes.
+        """
+        if not events:
+            return
+        now = datetime.utcnow()
+        rows = [
+            {
+                "actor_id": actor_id,
+                "action": action,
+                "target_type": target_type,
+                "target_id": target_id,
+                "message": message,
+                "created_at": now,
+            }
+            for action, target_type, target_id, message in events
+        ]
+        db.session.execute(insert(cls), rows)
+
+    @classmethod
+    def search(cls, q: str):
+        """Query for entries whose message contains q (case-insensitive substring).
+
+        Uses the logs_fts trigram index created by init-db, falling back to LIKE on
+        logs when this database has no FTS5 table; both match the same rows.
+        """
+        pattern = f"%{q}%"
+        has_fts = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'logs_fts'")
+        ).first()
+        if not has_fts:
+            return cls.query.filter(cls.message.ilike(pattern))
+        # LIKE on a trigram table is answered from the index (for q of 3+ characters).
+        matches = text("SELECT rowid FROM logs_fts WHERE message LIKE :pattern").bindparams(pattern=pattern)
+        return cls.query.filter(cls.id.in_(matches.columns(column("rowid", Integer))))
+
 
 class Setting(db.Model):
     __tablename__ = "settings"
@@ -219,11 +466,40 @@ class Setting(db.Model):
 
     __table_args__ = (UniqueConstraint("key", "scope", name="uq_settings_key_scope"),)
 
+    @classmethod
+    def get_cached(cls, key: str, scope: str = "global", default: Optional[str] = None) -> Optional[str]:
+        """Read a setting from the in-process cache, reloading the whole table every SETTINGS_TTL seconds."""
+        global _SETTING_CACHE
+        now = monotonic()
+        if _SETTING_CACHE is None or now >= _SETTING_CACHE[0]:
+            rows = db.session.execute(select(cls.key, cls.scope, cls.value)).all()
+            _SETTING_CACHE = (now + SETTINGS_TTL, {(k, s): v for k, s, v in rows})
+        return _SETTING_CACHE[1].get((key, scope), default)
+
+    @staticmethod
+    def invalidate_cache() -> None:
+        global _SETTING_CACHE
+        _SETTING_CACHE = None
+
+
+# (expires_at monotonic, (key, scope) -> value); None until first read. ORM writes to
+# Setting reset it via the mapper events below; Core statements (e.g. the seeder's upsert)
+# must call invalidate_cache(). The TTL bounds how long other workers serve an old value.
+SETTINGS_TTL = 10.0
+_SETTING_CACHE: Optional[tuple[float, dict[tuple[str, str], str]]] = None
+
+
+@event.listens_for(Setting, "after_insert")
+@event.listens_for(Setting, "after_update")
+@event.listens_for(Setting, "after_delete")
+def _invalidate_setting_cache(mapper, connection, target) -> None:
+    Setting.invalidate_cache()
+
 
 class Kiosk(db.Model):
     __tablename__ = "kiosks"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    token: Mapped[str] = mapped_column(String(64), unique=True, nullable=False, index=True)  # stores 32-char token
+    token: Mapped[str] = mapped_column(String(32), nullable=False)  # 32 hex chars, see new_token()
     name: Mapped[str] = mapped_column(String(120), nullable=False)
     room: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
     class_period_id: Mapped[Optional[int]] = mapped_column(ForeignKey("class_periods.id"), nullable=True)
@@ -232,3 +508,37 @@ class Kiosk(db.Model):
 
     class_period: Mapped[Optional["ClassPeriod"]] = relationship("ClassPeriod")
     teacher: Mapped[Optional["User"]] = relationship("User")
+
+    __table_args__ = (Index("ix_kiosks_token", "token", unique=True),)
+
+    @staticmethod
+    def new_token() -> str:
+        """Fixed-width 128-bit token; the default BINARY collation keeps lookups case-sensitive."""
+        return secrets.token_hex(16)
+
+
+# Loader options for pass list views: student and destination are many-to-one, so they
+# are joined into the list's own SELECT, and assigned staff come from Pass.staff_names.
+# Apply them through list_options() so the dev/test raiseload guard is added.
+PASS_LIST_OPTIONS = (joinedload(Pass.student), joinedload(Pass.destination))
+# Student-facing lists only show the destination.
+STUDENT_PASS_LIST_OPTIONS = (joinedload(Pass.destination),)
+
+
+def list_options(options: tuple) -> tuple:
+    """options, plus raiseload("*") while RAISELOAD_GUARD is on.
+
+    The guard makes any relationship a list template touches without prefetching raise
+    instead of quietly issuing one SELECT per row. It defaults to on under debug/testing;
+    in production an unprefetched access just lazy-loads.
+    """
+    guard = current_app.config.get("RAISELOAD_GUARD")
+    if guard is None:
+        guard = current_app.debug or current_app.testing
+    return (*options, raiseload("*")) if guard else options
+# A kiosk token resolves its bound period, that period's teacher and any bound teacher
+# in the same SELECT as the kiosk row.
+KIOSK_BINDING_OPTIONS = (
+    joinedload(Kiosk.class_period).joinedload(ClassPeriod.teacher),
+    joinedload(Kiosk.teacher),
+)
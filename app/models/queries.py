@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import aliased
+
+from .core import Destination, Pass, PassState, User
+
+
+# Prebuilt statements for hot paths. Built once at import, so every execution
+# reuses the same cache key in SQLAlchemy's compiled-statement cache.
+#
+# The read-only Core statements return plain rows (use .mappings() for dicts),
+# skipping ORM identity-map and relationship work; keep the ORM for anything
+# that writes.
+
+_student = aliased(User, name="student_user")
+
+# Kiosk board: currently active passes, newest first.
+KIOSK_ACTIVE_PASSES = (
+    select(
+        Pass.id,
+        _student.full_name.label("student"),
+        Destination.name.label("destination"),
+        Pass.issued_at,
+        Pass.expires_at,
+        Pass.staff_names.label("staff"),
+    )
+    .join(_student, _student.id == Pass.student_id)
+    .join(Destination, Destination.id == Pass.destination_id)
+    .where(Pass.state == PassState.ACTIVE)
+    .order_by(Pass.issued_at.desc())
+    .limit(100)
+)
+
+# Fingerprint of the kiosk board for its ETag, aggregated over exactly the rows the board
+# shows: changes when an active pass is added or removed (count, newest issue), has its
+# expiry moved (expiry total), or any displayed name changes (a teacher added to an
+# already-active pass, a renamed student or destination). One short row instead of the board.
+_board = KIOSK_ACTIVE_PASSES.subquery()
+KIOSK_BOARD_VERSION = select(
+    func.count(),
+    func.max(_board.c.issued_at),
+    func.total(func.julianday(_board.c.expires_at)),
+    func.group_concat(
+        func.printf("%d\x1f%s\x1f%s\x1f%s", _board.c.id, _board.c.student, _board.c.destination, _board.c.staff),
+        "\x1e",
+    ),
+)
+
+_due = (
+    Pass.state == PassState.ACTIVE,
+    Pass.expires_at.is_not(None),
+    Pass.expires_at <= bindparam("now"),
+)
+
+# Whether any pass is due to expire; checked on the reader first so pages that find
+# nothing to expire never take the write lock.
+ANY_PASS_DUE = select(select(Pass.id).where(*_due).exists())
+
+# Flip ACTIVE passes whose time is up to EXPIRED in one statement; execute with
+# {"now": ...}. RETURNING hands back the ids for the audit log without a SELECT first.
+EXPIRE_DUE_PASSES = (
+    update(Pass)
+    .where(*_due)
+    .values(state=PassState.EXPIRED)
+    .returning(Pass.id)
+    .execution_options(synchronize_session=False)
+)
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import sqlite3
+
+from sqlalchemy import String, inspect, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateColumn
+
+from app import db
+from .core import ClassPeriod, Pass, PassAssignment, PassState, hhmm_to_minutes, staff_names_for
+
+
+# Idempotent upgrades for databases created before a model change.
+# db.create_all() only creates missing tables, so anything added to an
+# existing table (indexes, columns, data conversions) is applied here.
+
+
+def _add_missing_columns(conn) -> None:
+    """ALTER TABLE ... ADD COLUMN for model columns the table doesn't have yet."""
+    insp = inspect(conn)
+    for table in db.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+
+def _convert_column(conn, column, expr_sql: str) -> None:
+    """Change a column's stored type in place: add a replacement column, fill it
+    from expr_sql (evaluated against the old column), then swap it in.
+
+    SQLite can't ALTER a column's type, and a full table rebuild would have to
+    drop tables that other tables reference. Indexes on the old column are
+    dropped here and recreated from the models afterwards.
+    """
+    if sqlite3.sqlite_version_info < (3, 35):
+        raise RuntimeError(
+            f"SQLite {sqlite3.sqlite_version} cannot drop columns; delete the database and re-run init-db."
+        )
+    table = column.table.name
+    tmp = f"{column.name}__new"
+    col_type = column.type.compile(dialect=conn.dialect)
+    not_null = "" if column.nullable else " NOT NULL DEFAULT 0"
+    for ix in inspect(conn).get_indexes(table):
+        if column.name in ix["column_names"]:
+            conn.exec_driver_sql(f"DROP INDEX {ix['name']}")
+    conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {tmp} {col_type}{not_null}")
+    conn.exec_driver_sql(f"UPDATE {table} SET {tmp} = {expr_sql}")
+    conn.exec_driver_sql(f"ALTER TABLE {table} DROP COLUMN {column.name}")
+    conn.exec_driver_sql(f"ALTER TABLE {table} RENAME COLUMN {tmp} TO {column.name}")
+
+
+def _stored_type(conn, column):
+    for c in inspect(conn).get_columns(column.table.name):
+        if c["name"] == column.name:
+            return c["type"]
+    return None
+
+
+def _convert_days_mask(conn) -> None:
+    """days_mask used to be a "1111100" string; store it as a Mon=bit0 bitmask."""
+    column = ClassPeriod.__table__.c.days_mask
+    if not isinstance(_stored_type(conn, column), String):
+        return
+    bits = " + ".join(f"{1 << i} * (substr(days_mask, {i + 1}, 1) = '1')" for i in range(7))
+    _convert_column(
+        conn,
+        column,
+        f"CASE WHEN length(days_mask) = 7 AND days_mask NOT GLOB '*[^01]*' THEN {bits} END",
+    )
+
+
+def _convert_pass_state(conn) -> None:
+    """Pass.state used to be stored as the enum name ("ACTIVE"); store the PassState int."""
+    column = Pass.__table__.c.state
+    if not isinstance(_stored_type(conn, column), String):
+        return
+    whens = " ".join(f"WHEN '{s.name}' THEN {s.value}" for s in PassState)
+    _convert_column(conn, column, f"CASE state {whens} ELSE {PassState.ARCHIVED.value} END")
+
+
+# Sync triggers for logs_fts. They live on logs, so anything that recreates logs
+# (drop-db followed by init-db) loses them even though logs_fts itself survives.
+_LOGS_FTS_TRIGGERS = {
+    "logs_fts_ai": """CREATE TRIGGER IF NOT EXISTS logs_fts_ai AFTER INSERT ON logs BEGIN
+            INSERT INTO logs_fts(rowid, message) VALUES (new.id, new.message);
+        END""",
+    "logs_fts_ad": """CREATE TRIGGER IF NOT EXISTS logs_fts_ad AFTER DELETE ON logs BEGIN
+            INSERT INTO logs_fts(logs_fts, rowid, message) VALUES ('delete', old.id, old.message);
+        END""",
+    "logs_fts_au": """CREATE TRIGGER IF NOT EXISTS logs_fts_au AFTER UPDATE ON logs BEGIN
+            INSERT INTO logs_fts(logs_fts, rowid, message) VALUES ('delete', old.id, old.message);
+            INSERT INTO logs_fts(rowid, message) VALUES (new.id, new.message);
+        END""",
+}
+
+
+def _create_logs_fts(conn) -> None:
+    """External-content FTS5 trigram index over logs.message, kept in sync by triggers.
+
+    The trigram tokenizer lets LogEntry.search use LIKE '%q%' against the index, so it
+    matches exactly what the LIKE fallback on logs would. Missing triggers are recreated
+    and the index rebuilt from logs whenever anything had to be (re)created.
+    """
+    if sqlite3.sqlite_version_info < (3, 34):  # trigram tokenizer first shipped in 3.34.0
+        return
+    existing = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'logs_fts'"
+    ).scalar()
+    rebuild = False
+    if existing is None or "trigram" not in existing:
+        if existing is not None:  # word-tokenized index from before the trigram switch
+            conn.exec_driver_sql("DROP TABLE logs_fts")
+        try:
+            conn.exec_driver_sql(
+                "CREATE VIRTUAL TABLE logs_fts USING fts5("
+                "message, content='logs', content_rowid='id', tokenize='trigram')"
+            )
+        except OperationalError:  # SQLite built without FTS5; LogEntry.search falls back to LIKE
+            return
+        rebuild = True
+    have = set(
+        conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'logs'").scalars()
+    )
+    for name, ddl in _LOGS_FTS_TRIGGERS.items():
+        if name not in have:
+            conn.exec_driver_sql(ddl)
+            rebuild = True
+    if rebuild:
+        # Re-index from logs; also clears rowids left over from a dropped logs table.
+        conn.exec_driver_sql("INSERT INTO logs_fts(logs_fts) VALUES ('rebuild')")
+
+
+def _backfill_staff_names(conn) -> None:
+    passes = Pass.__table__
+    has_staff = select(PassAssignment.id).where(PassAssignment.pass_id == passes.c.id).exists()
+    conn.execute(
+        update(passes)
+        .where(passes.c.staff_names == "", has_staff)
+        .values(staff_names=staff_names_for(passes.c.id))
+    )
+
+
+def _backfill_period_minutes(conn) -> None:
+    rows = conn.execute(
+        select(ClassPeriod.id, ClassPeriod.start_time, ClassPeriod.end_time).where(
+            (ClassPeriod.start_minutes.is_(None) & ClassPeriod.start_time.is_not(None))
+            | (ClassPeriod.end_minutes.is_(None) & ClassPeriod.end_time.is_not(None))
+        )
+    ).all()
+    for period_id, start_time, end_time in rows:
+        conn.execute(
+            update(ClassPeriod)
+            .where(ClassPeriod.id == period_id)
+            .values(start_minutes=hhmm_to_minutes(start_time), end_minutes=hhmm_to_minutes(end_time))
+        )
+
+
+def upgrade_schema() -> None:
+    """Bring an existing database up to date with the models. Safe to re-run."""
+    with db.engine.begin() as conn:
+        _add_missing_columns(conn)
+        _convert_days_mask(conn)
+        _convert_pass_state(conn)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)  # CREATE INDEX IF NOT EXISTS
+        conn.exec_driver_sql("DROP INDEX IF EXISTS ix_passassign_teacher")  # superseded by ix_passassign_teacher_pass
+        _backfill_period_minutes(conn)
+        _backfill_staff_names(conn)
+        _create_logs_fts(conn)
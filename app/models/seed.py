@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from flask import current_app
 from werkzeug.security import generate_password_hash
 
 from app import db
@@ -20,92 +22,102 @@ from .core import (
 )
 
 
+def _insert_ignore(model, rows: list[dict], index_elements: list[str]) -> None:
+    """INSERT OR IGNORE a batch of rows in a single statement."""
+    if rows:
+        db.session.execute(sqlite_insert(model).values(rows).on_conflict_do_nothing(index_elements=index_elements))
+
+
 def seed_data() -> None:
     # Roles
     role_names = ["Admin", "Teacher", "Student"]
+    _insert_ignore(Role, [{"name": name} for name in role_names], ["name"])
+    Role.invalidate_cache()
     roles = {r.name: r for r in Role.query.filter(Role.name.in_(role_names)).all()}
-    for name in role_names:
-        if name not in roles:
-            r = Role(name=name)
-            db.session.add(r)
-            roles[name] = r
-
-    db.session.flush()
 
-    # Users
-    def get_or_create_user(email: str, full_name: str, role_name: str) -> User:
-        user = User.query.filter_by(email=email).first()
-        if not user:
-            user = User(
-                email=email,
-                full_name=full_name,
-                password_hash=generate_password_hash("password"),
-                role_id=roles[role_name].id,
-                is_active_flag=1,
-            )
-            db.session.add(user)
-        return user
-
-    admin = get_or_create_user("admin@example.com", "Alice Admin", "Admin")
-    teacher = get_or_create_user("teacher@example.com", "Tom Teacher", "Teacher")
-    student = get_or_create_user("student@example.com", "Sam Student", "Student")
+    # Users (only hash passwords for accounts that don't exist yet)
+    seed_users = [
+        ("admin@example.com", "Alice Admin", "Admin"),
+        ("teacher@example.com", "Tom Teacher", "Teacher"),
+        ("student@example.com", "Sam Student", "Student"),
+    ]
+    emails = [email for email, _, _ in seed_users]
+    # Demo accounts don't need production-grade hashing cost when running in debug
+    hash_method = "pbkdf2:sha256:10000" if current_app.debug else current_app.config["PASSWORD_HASH_METHOD"]
+    existing_emails = {e for (e,) in db.session.query(User.email).filter(User.email.in_(emails)).all()}
+    _insert_ignore(
+        User,
+        [
+            {
+                "email": email,
+                "full_name": full_name,
+                "password_hash": generate_password_hash("password", method=hash_method),
+                "role_id": roles[role_name].id,
+                "is_active_flag": 1,
+            }
+            for email, full_name, role_name in seed_users
+            if email not in existing_emails
+        ],
+        ["email"],
+    )
+    users = {u.email: u for u in User.query.filter(User.email.in_(emails)).all()}
+    teacher = users["teacher@example.com"]
+    student = users["student@example.com"]
 
     # Destinations
-    def get_or_create_destination(name: str, default_minutes: int, max_concurrent: int) -> Destination:
-        d = Destination.query.filter_by(name=name).first()
-        if not d:
-            d = Destination(name=name, default_minutes=default_minutes, max_concurrent=max_concurrent)
-            db.session.add(d)
-        return d
-
-    restroom = get_or_create_destination("Restroom", default_minutes=5, max_concurrent=2)
-    nurse = get_or_create_destination("Nurse", default_minutes=10, max_concurrent=1)
-    counselor = get_or_create_destination("Counselor", default_minutes=15, max_concurrent=-1)
-
-    db.session.flush()
+    seed_destinations = [
+        {"name": "Restroom", "default_minutes": 5, "max_concurrent": 2},
+        {"name": "Nurse", "default_minutes": 10, "max_concurrent": 1},
+        {"name": "Counselor", "default_minutes": 15, "max_concurrent": -1},
+    ]
+    _insert_ignore(Destination, seed_destinations, ["name"])
+    destinations = {
+        d.name: d
+        for d in Destination.query.filter(Destination.name.in_([d["name"] for d in seed_destinations])).all()
+    }
+    restroom = destinations["Restroom"]
 
     # Class Periods and Enrollment
-    cp = ClassPeriod.query.filter_by(name="Algebra 1 - P1", teacher_id=teacher.id).first()
-    if not cp:
-        cp = ClassPeriod(name="Algebra 1 - P1", teacher_id=teacher.id, room="101", is_active=1)
-        db.session.add(cp)
-        db.session.flush()
-
-    enrollment = StudentEnrollment.query.filter_by(student_id=student.id, class_period_id=cp.id).first()
-    if not enrollment:
-        enrollment = StudentEnrollment(student_id=student.id, class_period_id=cp.id, is_active=1)
-        db.session.add(enrollment)
-
-    # Settings
-    def set_setting(key: str, value: str, scope: str = "global") -> None:
-        existing = Setting.query.filter_by(key=key, scope=scope).first()
-        if existing:
-            existing.value = value
-        else:
-            db.session.add(Setting(key=key, value=value, scope=scope))
+    _insert_ignore(
+        ClassPeriod,
+        [{"name": "Algebra 1 - P1", "teacher_id": teacher.id, "room": "101", "is_active": 1}],
+        ["name", "teacher_id"],
+    )
+    cp = ClassPeriod.query.filter_by(name="Algebra 1 - P1", teacher_id=teacher.id).one()
+    _insert_ignore(
+        StudentEnrollment,
+        [{"student_id": student.id, "class_period_id": cp.id, "is_active": 1}],
+        ["student_id", "class_period_id"],
+    )
 
-    set_setting("kiosk_auto_refresh_seconds", "10")
-    set_setting("near_expiry_seconds", "120")
-    # Prefer class-period-based kiosk auto-assign for demo (legacy global)
-    set_setting("kiosk_class_period_id", str(cp.id))
+    # Settings (upsert so re-seeding resets demo values)
+    stmt = sqlite_insert(Setting).values(
+        [
+            {"key": "kiosk_auto_refresh_seconds", "value": "10", "scope": "global"},
+            {"key": "near_expiry_seconds", "value": "120", "scope": "global"},
+            # Prefer class-period-based kiosk auto-assign for demo (legacy global)
+            {"key": "kiosk_class_period_id", "value": str(cp.id), "scope": "global"},
+        ]
+    )
+    db.session.execute(stmt.on_conflict_do_update(index_elements=["key", "scope"], set_={"value": stmt.excluded.value}))
+    Setting.invalidate_cache()
 
     # Create a demo kiosk bound to the class period with a generated 32-char token
-    import secrets
-    token = secrets.token_urlsafe(24)[:32]  # ~192 bits, 32 chars
-    existing_kiosk = Kiosk.query.filter_by(token=token).first()
-    if not existing_kiosk:
-        kiosk = Kiosk(
-            token=token,
-            name="Room 101 Kiosk",
-            room="101",
-            class_period_id=cp.id,
-            teacher_id=teacher.id,
-            is_active=1,
-        )
-        db.session.add(kiosk)
-
-    db.session.commit()
-    print(f"Demo kiosk token: {token}")
+    token = Kiosk.new_token()
+    _insert_ignore(
+        Kiosk,
+        [
+            {
+                "token": token,
+                "name": "Room 101 Kiosk",
+                "room": "101",
+                "class_period_id": cp.id,
+                "teacher_id": teacher.id,
+                "is_active": 1,
+            }
+        ],
+        ["token"],
+    )
 
     # Example active pass (approved)
     existing_active = (
@@ -121,9 +133,9 @@ def seed_data() -> None:
             expires_at=expires,
             state=PassState.ACTIVE,
         )
+        p.assignments.append(PassAssignment(teacher_id=teacher.id))
         db.session.add(p)
-        db.session.flush()
-        db.session.add(PassAssignment(pass_id=p.id, teacher_id=teacher.id))
+        db.session.flush()  # the log entry needs p.id
         db.session.add(
             LogEntry(
                 actor_id=teacher.id,
@@ -133,4 +145,7 @@ def seed_data() -> None:
                 message=f"Issued to {student.full_name} for {restroom.name}",
             )
         )
-        db.session.commit()
+
+    # Everything above lands in one transaction
+    db.session.commit()
+    print(f"Demo kiosk token: {token}")
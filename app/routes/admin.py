@@ -1,61 +1,106 @@
 from __future__ import annotations
 
 from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from time import monotonic, time
+from typing import Optional
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file
+from flask import Blueprint, Response, current_app, jsonify, render_template, request, redirect, url_for, flash, stream_with_context
 from flask_login import login_required, current_user
-from io import StringIO, BytesIO
+from sqlalchemy import case, delete, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import contains_eager, selectinload
+from io import StringIO
 import csv
-import base64
 import json
+import os
+import re
+import secrets
 
-from app import db
-from app.models.core import Role, User, Destination, Pass, PassState, LogEntry, Setting, Kiosk, ClassPeriod, StudentEnrollment
+from app import db, hash_password, read_session
+from app.models.core import Role, User, Destination, Pass, LogEntry, Setting, Kiosk, ClassPeriod, StudentEnrollment, hhmm_to_minutes, parse_days_mask, pass_write_count
 
 bp = Blueprint("admin", __name__)
 
 
-def require_admin():
-    if current_user.role.name != "Admin":
-        flash("Admin access required.", "danger")
-        return redirect(url_for("main.dashboard"))
-    return None
+def admin_required(view):
+    """Redirect non-admins to the dashboard before the view runs. Goes under @login_required."""
+
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if current_user.role.name != "Admin":
+            flash("Admin access required.", "danger")
+            return redirect(url_for("main.dashboard"))
+        return view(*args, **kwargs)
+
+    return wrapped
+
+
+# Active teachers for the kiosk and class-period pickers, as (id, full_name, email) rows.
+# The user routes below drop it on writes; the TTL covers accounts created elsewhere
+# (self-registration) or by another process.
+TEACHERS_TTL = 60.0
+_teachers_cache: Optional[tuple[float, list]] = None  # (expires, rows)
+
+
+def _active_teachers() -> list:
+    global _teachers_cache
+    now = monotonic()
+    if _teachers_cache is None or now >= _teachers_cache[0]:
+        rows = db.session.execute(
+            select(User.id, User.full_name, User.email)
+            .join(Role, Role.id == User.role_id)
+            .where(Role.name == "Teacher", User.is_active)
+            .order_by(User.full_name.asc())
+        ).all()
+        _teachers_cache = (now + TEACHERS_TTL, rows)
+    return _teachers_cache[1]
+
+
+def _forget_teachers() -> None:
+    global _teachers_cache
+    _teachers_cache = None
+
+
+def _is_xhr() -> bool:
+    """True for fetch() submits from app.js, which patch the row in place instead of reloading."""
+    return request.headers.get("X-Requested-With") == "XMLHttpRequest"
+
+
+def _xhr_reply(message: str, status: int = 200, **data):
+    """JSON answer for an XHR submit: app.js shows message inline and never resubmits."""
+    return jsonify(message=message, **data), status
 
 
 @bp.route("/")
 @login_required
+@admin_required
 def index():
-    redir = require_admin()
-    if redir:
-        return redir
     users = User.query.order_by(User.full_name).limit(50).all()
     destinations = Destination.query.order_by(Destination.name).all()
-    active_passes = Pass.query.filter_by(state=PassState.ACTIVE).count()
+    active_passes = Pass.active_count()
     return render_template("admin/index.html", users=users, destinations=destinations, active_passes=active_passes)
 
 
 # Users
 @bp.route("/users")
 @login_required
+@admin_required
 def users():
-    redir = require_admin()
-    if redir:
-        return redir
     q = request.args.get("q", "").strip()
     query = User.query
     if q:
         query = query.filter(User.full_name.ilike(f"%{q}%") | User.email.ilike(f"%{q}%"))
-    users = query.order_by(User.full_name).limit(200).all()
+    users = query.options(selectinload(User.role)).order_by(User.full_name).limit(200).all()
     roles = Role.query.order_by(Role.name).all()
     return render_template("admin/users.html", users=users, roles=roles, q=q)
 
 
 @bp.route("/users/create", methods=["POST"])
 @login_required
+@admin_required
 def users_create():
-    redir = require_admin()
-    if redir:
-        return redir
     full_name = request.form.get("full_name", "").strip()
     email = request.form.get("email", "").strip().lower()
     role_id = int(request.form.get("role_id", "0"))
@@ -69,72 +114,79 @@ def users_create():
     if not password:
         flash("Password is required.", "warning")
         return redirect(url_for("admin.users"))
-    from werkzeug.security import generate_password_hash
-    u = User(full_name=full_name, email=email, role_id=role_id, is_active_flag=1, password_hash=generate_password_hash(password))
+    u = User(full_name=full_name, email=email, role_id=role_id, is_active_flag=1, password_hash=hash_password(password))
     db.session.add(u)
     db.session.flush()
     db.session.add(LogEntry(actor_id=current_user.id, action="user_created", target_type="user", target_id=u.id, message=email))
     db.session.commit()
+    _forget_teachers()
     flash("User created with password.", "success")
     return redirect(url_for("admin.users"))
 
 
 @bp.route("/users/<int:user_id>/toggle", methods=["POST"])
 @login_required
+@admin_required
 def users_toggle(user_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
-    u = db.session.get(User, user_id)
-    if not u:
+    is_active = db.session.scalar(
+        update(User)
+        .where(User.id == user_id)
+        .values(is_active_flag=case((User.is_active_flag == 1, 0), else_=1))
+        .returning(User.is_active_flag)
+    )
+    if is_active is None:
+        if _is_xhr():
+            return _xhr_reply("User not found.", 404)
         flash("User not found.", "warning")
+        return redirect(url_for("admin.users"))
+    db.session.add(LogEntry(actor_id=current_user.id, action="user_toggle", target_type="user", target_id=user_id))
+    db.session.commit()
+    _forget_teachers()
+    if _is_xhr():
+        # The row is re-rendered from the stored flag, not by flipping what the page showed.
+        return _xhr_reply("User status updated.", is_active=is_active == 1)
+    flash("User status updated.", "success")
     return redirect(url_for("admin.users"))
 
 
 @bp.route("/users/<int:user_id>/reset_password", methods=["POST"])
 @login_required
+@admin_required
 def users_reset_password(user_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
     u = db.session.get(User, user_id)
     if not u:
+        if _is_xhr():
+            return _xhr_reply("User not found.", 404)
         flash("User not found.", "warning")
         return redirect(url_for("admin.users"))
     new_password = request.form.get("new_password", "").strip()
     if not new_password:
+        if _is_xhr():
+            return _xhr_reply("New password is required.", 400)
         flash("New password is required.", "warning")
         return redirect(url_for("admin.users"))
-    from werkzeug.security import generate_password_hash
-    u.password_hash = generate_password_hash(new_password)
+    u.password_hash = hash_password(new_password)
     db.session.add(LogEntry(actor_id=current_user.id, action="user_password_reset", target_type="user", target_id=u.id, message=u.email))
     db.session.commit()
+    if _is_xhr():
+        return _xhr_reply("Password reset.")
     flash("Password reset.", "success")
     return redirect(url_for("admin.users"))
-    u.is_active_flag = 0 if u.is_active_flag else 1
-    db.session.add(LogEntry(actor_id=current_user.id, action="user_toggle", target_type="user", target_id=u.id))
-    db.session.commit()
-    flash("User status updated.", "success")
-    return redirect(url_for("admin.users"))
 
 
 # Destinations
 @bp.route("/destinations")
 @login_required
+@admin_required
 def destinations():
-    redir = require_admin()
-    if redir:
-        return redir
     dests = Destination.query.order_by(Destination.name).all()
     return render_template("admin/destinations.html", destinations=dests)
 
 
 @bp.route("/destinations/create", methods=["POST"])
 @login_required
+@admin_required
 def destinations_create():
-    redir = require_admin()
-    if redir:
-        return redir
     name = request.form.get("name", "").strip()
     default_minutes = int(request.form.get("default_minutes", "5"))
     max_concurrent = int(request.form.get("max_concurrent", "-1"))
@@ -154,10 +206,8 @@ def destinations_create():
 
 @bp.route("/destinations/<int:dest_id>/update", methods=["POST"])
 @login_required
+@admin_required
 def destinations_update(dest_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
     d = db.session.get(Destination, dest_id)
     if not d:
         flash("Destination not found.", "warning")
@@ -173,28 +223,30 @@ def destinations_update(dest_id: int):
 # Kiosks
 @bp.route("/kiosks")
 @login_required
+@admin_required
 def kiosks():
-    redir = require_admin()
-    if redir:
-        return redir
-    kiosks = Kiosk.query.order_by(Kiosk.name).all()
-    periods = ClassPeriod.query.order_by(ClassPeriod.name).all()
-    teachers = User.query.join(Role, Role.id == User.role_id).filter(Role.name == "Teacher", User.is_active_flag == 1).order_by(User.full_name).all()
+    kiosks = (
+        Kiosk.query.options(
+            selectinload(Kiosk.class_period).selectinload(ClassPeriod.teacher),
+            selectinload(Kiosk.teacher),
+        )
+        .order_by(Kiosk.name)
+        .all()
+    )
+    periods = ClassPeriod.query.options(selectinload(ClassPeriod.teacher)).order_by(ClassPeriod.name).all()
+    teachers = _active_teachers()
     return render_template("admin/kiosks.html", kiosks=kiosks, periods=periods, teachers=teachers)
 
 
 @bp.route("/kiosks/create", methods=["POST"])
 @login_required
+@admin_required
 def kiosks_create():
-    redir = require_admin()
-    if redir:
-        return redir
     name = request.form.get("name", "").strip()
     room = request.form.get("room", "").strip() or None
     class_period_id = request.form.get("class_period_id") or None
     teacher_id = request.form.get("teacher_id") or None
-    import secrets
-    token = secrets.token_urlsafe(24)[:32]
+    token = Kiosk.new_token()
     if not name:
         flash("Name is required.", "warning")
         return redirect(url_for("admin.kiosks"))
@@ -215,16 +267,16 @@ def kiosks_create():
 
 @bp.route("/kiosks/<int:kiosk_id>/toggle", methods=["POST"])
 @login_required
+@admin_required
 def kiosks_toggle(kiosk_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
-    k = db.session.get(Kiosk, kiosk_id)
-    if not k:
+    # Flip in one UPDATE; rowcount doubles as the existence check
+    result = db.session.execute(
+        update(Kiosk).where(Kiosk.id == kiosk_id).values(is_active=case((Kiosk.is_active == 1, 0), else_=1))
+    )
+    if not result.rowcount:
         flash("Kiosk not found.", "warning")
         return redirect(url_for("admin.kiosks"))
-    k.is_active = 0 if k.is_active else 1
-    db.session.add(LogEntry(actor_id=current_user.id, action="kiosk_toggle", target_type="kiosk", target_id=k.id))
+    db.session.add(LogEntry(actor_id=current_user.id, action="kiosk_toggle", target_type="kiosk", target_id=kiosk_id))
     db.session.commit()
     flash("Kiosk status updated.", "success")
     return redirect(url_for("admin.kiosks"))
@@ -232,28 +284,23 @@ def kiosks_toggle(kiosk_id: int):
 
 @bp.route("/kiosks/<int:kiosk_id>/rotate", methods=["POST"])
 @login_required
+@admin_required
 def kiosks_rotate(kiosk_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
-    k = db.session.get(Kiosk, kiosk_id)
-    if not k:
+    token = Kiosk.new_token()
+    result = db.session.execute(update(Kiosk).where(Kiosk.id == kiosk_id).values(token=token))
+    if not result.rowcount:
         flash("Kiosk not found.", "warning")
         return redirect(url_for("admin.kiosks"))
-    import secrets
-    k.token = secrets.token_urlsafe(24)[:32]
-    db.session.add(LogEntry(actor_id=current_user.id, action="kiosk_rotated", target_type="kiosk", target_id=k.id))
+    db.session.add(LogEntry(actor_id=current_user.id, action="kiosk_rotated", target_type="kiosk", target_id=kiosk_id))
     db.session.commit()
-    flash(f"Kiosk token rotated. New token: {k.token}", "success")
+    flash(f"Kiosk token rotated. New token: {token}", "success")
     return redirect(url_for("admin.kiosks"))
 
 
 @bp.route("/kiosks/<int:kiosk_id>/bind", methods=["POST"])
 @login_required
+@admin_required
 def kiosks_bind(kiosk_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
     k = db.session.get(Kiosk, kiosk_id)
     if not k:
         flash("Kiosk not found.", "warning")
@@ -271,10 +318,8 @@ def kiosks_bind(kiosk_id: int):
 # Settings
 @bp.route("/settings", methods=["GET", "POST"])
 @login_required
+@admin_required
 def settings():
-    redir = require_admin()
-    if redir:
-        return redir
     if request.method == "POST":
         for key in ["kiosk_auto_refresh_seconds", "near_expiry_seconds"]:
             if key in request.form:
@@ -295,67 +340,92 @@ def settings():
 # Logs and export
 @bp.route("/logs")
 @login_required
+@admin_required
 def logs():
-    redir = require_admin()
-    if redir:
-        return redir
-    items = LogEntry.query.order_by(LogEntry.created_at.desc()).limit(200).all()
-    return render_template("admin/logs.html", items=items)
+    q = request.args.get("q", "").strip()
+    query = LogEntry.search(q) if q else LogEntry.query
+    items = query.order_by(LogEntry.created_at.desc()).limit(200).all()
+    return render_template("admin/logs.html", items=items, q=q)
 
 
 @bp.route("/logs/export")
 @login_required
+@admin_required
 def logs_export():
-    redir = require_admin()
-    if redir:
-        return redir
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(["created_at", "actor_id", "action", "target_type", "target_id", "message"])
-    for l in LogEntry.query.order_by(LogEntry.created_at.desc()).all():
-        writer.writerow([l.created_at, l.actor_id, l.action, l.target_type, l.target_id, l.message or ""])
-    si.seek(0)
-    return send_file(
-        si,
+    stmt = (
+        select(LogEntry.created_at, LogEntry.actor_id, LogEntry.action, LogEntry.target_type, LogEntry.target_id, LogEntry.message)
+        .order_by(LogEntry.created_at.desc())
+        .execution_options(yield_per=1000)
+    )
+
+    def generate():
+        # Stream in chunks of yield_per rows from the read-only bind instead of
+        # building the whole file in memory.
+        buf = StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["created_at", "actor_id", "action", "target_type", "target_id", "message"])
+        with read_session() as session:
+            for rows in session.execute(stmt).partitions():
+                writer.writerows((*r[:5], r[5] or "") for r in rows)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate(0)
+        yield buf.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
         mimetype="text/csv",
-        as_attachment=True,
-        download_name="logs.csv",
+        headers={"Content-Disposition": "attachment; filename=logs.csv"},
     )
 
 
+# Metrics are full-table GROUP BYs over passes that change slowly, so they are cached
+# for METRICS_TTL seconds. Any pass write made through this process drops the cache early.
+METRICS_TTL = 60.0
+_metrics_cache: Optional[tuple[float, int, dict]] = None  # (expires, pass_write_count, data)
+
+
 # Simple metrics
 @bp.route("/metrics")
 @login_required
+@admin_required
 def metrics():
-    redir = require_admin()
-    if redir:
-        return redir
-    # Top destinations by pass count
-    dest_counts = (
-        db.session.query(Destination.name, db.func.count(Pass.id))
-        .join(Pass, Pass.destination_id == Destination.id, isouter=True)
-        .group_by(Destination.id)
-        .order_by(db.func.count(Pass.id).desc())
-        .limit(10)
-        .all()
-    )
-    # Frequent students
-    student_counts = (
-        db.session.query(User.full_name, db.func.count(Pass.id))
-        .join(Pass, Pass.student_id == User.id)
-        .group_by(User.id)
-        .order_by(db.func.count(Pass.id).desc())
-        .limit(10)
-        .all()
-    )
-    # Peak times (hour)
-    hourly = (
-        db.session.query(db.func.strftime("%H", Pass.issued_at), db.func.count(Pass.id))
-        .group_by(db.func.strftime("%H", Pass.issued_at))
-        .order_by(db.func.count(Pass.id).desc())
-        .all()
-    )
-    return render_template("admin/metrics.html", dest_counts=dest_counts, student_counts=student_counts, hourly=hourly)
+    global _metrics_cache
+    now = monotonic()
+    writes = pass_write_count()
+    if _metrics_cache is None or now >= _metrics_cache[0] or writes != _metrics_cache[1]:
+        _metrics_cache = (now + METRICS_TTL, writes, _compute_metrics())
+    return render_template("admin/metrics.html", **_metrics_cache[2])
+
+
+def _compute_metrics() -> dict:
+    # Runs on the read-only bind so these full-table scans never hold the writer connection.
+    with read_session() as session:
+        # Each aggregate is labelled once and GROUP BY / ORDER BY refer to the label,
+        # so SQLite evaluates the expression once per row.
+        cnt = db.func.count(Pass.id).label("cnt")
+        # Top destinations by pass count
+        dest_counts = (
+            session.query(Destination.name, cnt)
+            .join(Pass, Pass.destination_id == Destination.id, isouter=True)
+            .group_by(Destination.id)
+            .order_by(cnt.desc())
+            .limit(10)
+            .all()
+        )
+        # Frequent students
+        student_counts = (
+            session.query(User.full_name, cnt)
+            .join(Pass, Pass.student_id == User.id)
+            .group_by(User.id)
+            .order_by(cnt.desc())
+            .limit(10)
+            .all()
+        )
+        # Peak times (hour)
+        hour = db.func.strftime("%H", Pass.issued_at).label("hour")
+        hourly = session.query(hour, cnt).group_by(hour).order_by(cnt.desc()).all()
+        return {"dest_counts": dest_counts, "student_counts": student_counts, "hourly": hourly}
 
 
 # -----------------------------
@@ -363,37 +433,94 @@ def metrics():
 # -----------------------------
 @bp.route("/import")
 @login_required
+@admin_required
 def import_view():
-    redir = require_admin()
-    if redir:
-        return redir
     return render_template("admin/import.html", report=None)
 
 
-def _b64encode_dict(d: dict) -> str:
-    raw = json.dumps(d).encode("utf-8")
-    return base64.b64encode(raw).decode("ascii")
-
-
-def _b64decode_dict(s: str) -> dict:
-    raw = base64.b64decode(s.encode("ascii"))
-    return json.loads(raw.decode("utf-8"))
+# Dry-run results are parked server-side under a random token until execute, so the
+# page carries only the token rather than the whole payload in hidden fields.
+_IMPORT_TOKEN_RE = re.compile(r"[0-9a-f]{32}")
+_IMPORT_MAX_AGE = 3600  # seconds; older unexecuted dry runs are swept on the next dry run
+
+
+def _import_dir() -> Path:
+    path = Path(current_app.instance_path) / "imports"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _stash_import(payload: dict) -> str:
+    folder = _import_dir()
+    cutoff = time() - _IMPORT_MAX_AGE
+    # *.claimed files are only left behind if a worker died between claiming and deleting.
+    for old in [*folder.glob("*.json"), *folder.glob("*.claimed")]:
+        try:
+            if old.stat().st_mtime < cutoff:
+                old.unlink(missing_ok=True)
+        except FileNotFoundError:  # claimed by a concurrent execute
+            pass
+    token = secrets.token_hex(16)
+    (folder / f"{token}.json").write_text(json.dumps(payload, separators=(",", ":")), encoding="utf-8")
+    return token
+
+
+def _pop_import(token: str) -> Optional[dict]:
+    """Return and delete the payload stored under token; None if unknown or already used."""
+    if not _IMPORT_TOKEN_RE.fullmatch(token):
+        return None
+    path = _import_dir() / f"{token}.json"
+    # Claim by renaming first: os.replace is atomic, so of two concurrent executes with the
+    # same token exactly one gets the file and the other sees it as already executed.
+    claimed = path.with_suffix(f".{secrets.token_hex(4)}.claimed")
+    try:
+        os.replace(path, claimed)
+    except FileNotFoundError:
+        return None
+    try:
+        return json.loads(claimed.read_text(encoding="utf-8"))
+    finally:
+        claimed.unlink(missing_ok=True)
 
 
 def _read_csv_upload(file_storage):
     if not file_storage:
         return []
-    text = file_storage.read().decode("utf-8", errors="ignore")
-    reader = csv.DictReader(text.splitlines())
-    return list(reader)
+    # Read the whole upload (bounded by MAX_CONTENT_LENGTH) rather than wrapping its stream:
+    # Werkzeug spools large uploads to a SpooledTemporaryFile, which TextIOWrapper can't
+    # wrap before Python 3.11. utf-8-sig drops the BOM spreadsheet exports add.
+    # Rows are materialised because the dry run reads them twice (lookup pre-scan + report).
+    text = StringIO(file_storage.read().decode("utf-8-sig", errors="ignore"), newline="")
+    return list(csv.DictReader(text))
+
+
+_IMPORT_PERIOD_FIELDS = ("name", "teacher_id", "start_time", "end_time", "days_mask", "is_active")
+_IMPORT_ENROLLMENT_FIELDS = ("student_id", "class_period_id", "is_active")
+
+
+def _import_period_row(d: dict) -> dict:
+    """Whitelisted ClassPeriod fields from an import payload entry, plus the minute
+    columns that ClassPeriod's validator would normally derive."""
+    row = {k: d[k] for k in _IMPORT_PERIOD_FIELDS if k in d}
+    if "start_time" in row:
+        row["start_minutes"] = hhmm_to_minutes(row["start_time"])
+    if "end_time" in row:
+        row["end_minutes"] = hhmm_to_minutes(row["end_time"])
+    return row
+
+
+def _existing_only(model, rows: list[dict]) -> list[dict]:
+    """Drop update rows whose id no longer exists (one IN query)."""
+    if not rows:
+        return rows
+    found = set(db.session.scalars(select(model.id).where(model.id.in_([r["id"] for r in rows]))))
+    return [r for r in rows if r["id"] in found]
 
 
 @bp.route("/import/dry-run", methods=["POST"])
 @login_required
+@admin_required
 def import_dry_run():
-    redir = require_admin()
-    if redir:
-        return redir
     periods_rows = _read_csv_upload(request.files.get("periods_csv"))
     enroll_rows = _read_csv_upload(request.files.get("enrollments_csv"))
 
@@ -402,22 +529,52 @@ def import_dry_run():
         "enrollments": {"create": [], "update": [], "errors": []},
     }
 
+    # Resolve every referenced user, period and enrollment up front with IN queries,
+    # so the per-row loops below are plain dict lookups.
+    emails = {(r.get("teacher_email") or "").strip().lower() for r in periods_rows}
+    emails |= {(r.get("student_email") or "").strip().lower() for r in enroll_rows}
+    emails.discard("")
+    users_by_email = {u.email: u for u in User.query.filter(User.email.in_(emails)).all()} if emails else {}
+    period_names = {(r.get("name") or "").strip() for r in periods_rows}
+    period_names |= {(r.get("class_period_name") or "").strip() for r in enroll_rows}
+    period_names.discard("")
+    periods_by_name: dict[str, ClassPeriod] = {}
+    periods_by_key: dict[tuple[str, int], ClassPeriod] = {}
+    if period_names:
+        for cp in ClassPeriod.query.filter(ClassPeriod.name.in_(period_names)).order_by(ClassPeriod.id).all():
+            periods_by_name.setdefault(cp.name, cp)
+            periods_by_key[(cp.name, cp.teacher_id)] = cp
+    pairs = set()
+    for r in enroll_rows:
+        cp = periods_by_name.get((r.get("class_period_name") or "").strip())
+        student = users_by_email.get((r.get("student_email") or "").strip().lower())
+        if cp and student:
+            pairs.add((student.id, cp.id))
+    enrollments_by_pair = {}
+    if pairs:
+        enrollments_by_pair = {
+            (e.student_id, e.class_period_id): e
+            for e in StudentEnrollment.query.filter(
+                tuple_(StudentEnrollment.student_id, StudentEnrollment.class_period_id).in_(pairs)
+            ).all()
+        }
+
     # Periods
     for i, r in enumerate(periods_rows, start=2):  # start=2 for header offset
         name = (r.get("name") or "").strip()
         teacher_email = (r.get("teacher_email") or "").strip().lower()
         start_time = (r.get("start_time") or "").strip() or None
         end_time = (r.get("end_time") or "").strip() or None
-        days_mask = (r.get("days_mask") or "").strip() or None
+        days_mask = parse_days_mask((r.get("days_mask") or "").strip())
         is_active = 1 if (r.get("is_active") or "1").strip() == "1" else 0
         if not name or not teacher_email:
             report["periods"]["errors"].append(f"Row {i}: name and teacher_email required")
             continue
-        teacher = User.query.filter_by(email=teacher_email).first()
+        teacher = users_by_email.get(teacher_email)
         if not teacher:
             report["periods"]["errors"].append(f"Row {i}: teacher not found: {teacher_email}")
             continue
-        existing = ClassPeriod.query.filter_by(name=name, teacher_id=teacher.id).first()
+        existing = periods_by_key.get((name, teacher.id))
         if existing:
             report["periods"]["update"].append(
                 {"id": existing.id, "name": name, "teacher_id": teacher.id, "start_time": start_time, "end_time": end_time, "days_mask": days_mask, "is_active": is_active}
@@ -435,70 +592,64 @@ def import_dry_run():
         if not period_name or not student_email:
             report["enrollments"]["errors"].append(f"Row {i}: class_period_name and student_email required")
             continue
-        period = ClassPeriod.query.filter_by(name=period_name).first()
+        period = periods_by_name.get(period_name)
         if not period:
             report["enrollments"]["errors"].append(f"Row {i}: class period not found: {period_name}")
             continue
-        student = User.query.filter_by(email=student_email).first()
+        student = users_by_email.get(student_email)
         if not student:
             report["enrollments"]["errors"].append(f"Row {i}: student not found: {student_email}")
             continue
-        existing = StudentEnrollment.query.filter_by(student_id=student.id, class_period_id=period.id).first()
+        existing = enrollments_by_pair.get((student.id, period.id))
         if existing:
             report["enrollments"]["update"].append({"id": existing.id, "student_id": student.id, "class_period_id": period.id, "is_active": is_active})
         else:
             report["enrollments"]["create"].append({"student_id": student.id, "class_period_id": period.id, "is_active": is_active})
 
-    payload = {
-        "periods_payload": _b64encode_dict({"create": report["periods"]["create"], "update": report["periods"]["update"]}),
-        "enrollments_payload": _b64encode_dict({"create": report["enrollments"]["create"], "update": report["enrollments"]["update"]}),
-    }
-    return render_template("admin/import.html", report={**report, **payload})
+    # A clean re-import has nothing to apply: skip serialising and writing an empty stash
+    if not any(report[k][op] for k in ("periods", "enrollments") for op in ("create", "update")):
+        return render_template("admin/import.html", report={**report, "import_token": ""})
+    import_token = _stash_import(
+        {
+            "periods": {"create": report["periods"]["create"], "update": report["periods"]["update"]},
+            "enrollments": {"create": report["enrollments"]["create"], "update": report["enrollments"]["update"]},
+        }
+    )
+    return render_template("admin/import.html", report={**report, "import_token": import_token})
 
 
 @bp.route("/import/execute", methods=["POST"])
 @login_required
+@admin_required
 def import_execute():
-    redir = require_admin()
-    if redir:
-        return redir
-    try:
-        periods_payload = _b64decode_dict(request.form.get("periods_payload", ""))
-        enrollments_payload = _b64decode_dict(request.form.get("enrollments_payload", ""))
-    except Exception:
-        flash("Invalid import payload.", "danger")
+    payload = _pop_import(request.form.get("import_token", ""))
+    if payload is None:
+        flash("Import expired or already executed; run the dry run again.", "danger")
         return redirect(url_for("admin.import_view"))
+    periods_payload = payload["periods"]
+    enrollments_payload = payload["enrollments"]
+
+    # Bulk mappings skip per-object ORM bookkeeping (and @validates; see _import_period_row)
+    period_creates = [_import_period_row(d) for d in periods_payload.get("create", [])]
+    period_updates = [{"id": d["id"], **_import_period_row(d)} for d in periods_payload.get("update", []) if d.get("id")]
+    period_updates = _existing_only(ClassPeriod, period_updates)
+    db.session.bulk_insert_mappings(ClassPeriod, period_creates)
+    db.session.bulk_update_mappings(ClassPeriod, period_updates)
+    created_p, updated_p = len(period_creates), len(period_updates)
+
+    enrollment_creates = [
+        {k: d[k] for k in _IMPORT_ENROLLMENT_FIELDS if k in d} for d in enrollments_payload.get("create", [])
+    ]
+    enrollment_updates = [
+        {"id": d["id"], **{k: d[k] for k in _IMPORT_ENROLLMENT_FIELDS if k in d}}
+        for d in enrollments_payload.get("update", [])
+        if d.get("id")
+    ]
+    enrollment_updates = _existing_only(StudentEnrollment, enrollment_updates)
+    db.session.bulk_insert_mappings(StudentEnrollment, enrollment_creates)
+    db.session.bulk_update_mappings(StudentEnrollment, enrollment_updates)
+    created_e, updated_e = len(enrollment_creates), len(enrollment_updates)
 
-    created_p, updated_p = 0, 0
-    for d in periods_payload.get("create", []):
-        p = ClassPeriod(**d)  # type: ignore[arg-type]
-        db.session.add(p)
-        created_p += 1
-    for d in periods_payload.get("update", []):
-        p = db.session.get(ClassPeriod, d.get("id"))
-        if not p:
-            continue
-        for k in ["name", "teacher_id", "start_time", "end_time", "days_mask", "is_active"]:
-            if k in d:
-                setattr(p, k, d[k])
-        updated_p += 1
-    db.session.flush()
-
-    created_e, updated_e = 0, 0
-    for d in enrollments_payload.get("create", []):
-        e = StudentEnrollment(**d)  # type: ignore[arg-type]
-        db.session.add(e)
-        created_e += 1
-    for d in enrollments_payload.get("update", []):
-        e = db.session.get(StudentEnrollment, d.get("id"))
-        if not e:
-            continue
-        for k in ["student_id", "class_period_id", "is_active"]:
-            if k in d:
-                setattr(e, k, d[k])
-        updated_e += 1
-
-    db.session.commit()
     db.session.add(
         LogEntry(
             actor_id=current_user.id,
@@ -515,7 +666,7 @@ def import_execute():
             message=f"created={created_e} updated={updated_e}",
         )
     )
-    db.session.commit()
+    db.session.commit()  # data and both log entries in one transaction
     flash(f"Import complete: Periods c/u {created_p}/{updated_p}, Enrollments c/u {created_e}/{updated_e}", "success")
     return redirect(url_for("admin.import_view"))
 
@@ -525,31 +676,22 @@ def import_execute():
 # -----------------------------
 @bp.route("/periods")
 @login_required
+@admin_required
 def periods():
-    redir = require_admin()
-    if redir:
-        return redir
-    periods = ClassPeriod.query.order_by(ClassPeriod.name.asc()).all()
-    teachers = (
-        User.query.join(Role, Role.id == User.role_id)
-        .filter(Role.name == "Teacher", User.is_active_flag == 1)
-        .order_by(User.full_name.asc())
-        .all()
-    )
+    periods = ClassPeriod.query.options(selectinload(ClassPeriod.teacher)).order_by(ClassPeriod.name.asc()).all()
+    teachers = _active_teachers()
     return render_template("admin/periods.html", periods=periods, teachers=teachers)
 
 
 @bp.route("/periods/create", methods=["POST"])
 @login_required
+@admin_required
 def periods_create():
-    redir = require_admin()
-    if redir:
-        return redir
     name = request.form.get("name", "").strip()
     teacher_id = request.form.get("teacher_id")
     start_time = request.form.get("start_time", "").strip() or None
     end_time = request.form.get("end_time", "").strip() or None
-    days_mask = request.form.get("days_mask", "").strip() or None
+    days_mask = parse_days_mask(request.form.get("days_mask", "").strip())
     room = request.form.get("room", "").strip() or None
     is_active = 1 if request.form.get("is_active", "1") == "1" else 0
     if not name or not teacher_id:
@@ -578,10 +720,8 @@ def periods_create():
 
 @bp.route("/periods/<int:period_id>/update", methods=["POST"])
 @login_required
+@admin_required
 def periods_update(period_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
     p = db.session.get(ClassPeriod, period_id)
     if not p:
         flash("Period not found.", "warning")
@@ -590,7 +730,7 @@ def periods_update(period_id: int):
     teacher_id = request.form.get("teacher_id") or str(p.teacher_id)
     start_time = request.form.get("start_time", "").strip() or None
     end_time = request.form.get("end_time", "").strip() or None
-    days_mask = request.form.get("days_mask", "").strip() or None
+    days_mask = parse_days_mask(request.form.get("days_mask", "").strip())
     room = request.form.get("room", "").strip() or None
     is_active = 1 if request.form.get("is_active", "1") == "1" else 0
     try:
@@ -615,10 +755,8 @@ def periods_update(period_id: int):
 # -----------------------------
 @bp.route("/periods/<int:period_id>/enrollments")
 @login_required
+@admin_required
 def period_enrollments(period_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
     p = db.session.get(ClassPeriod, period_id)
     if not p:
         flash("Period not found.", "warning")
@@ -626,6 +764,7 @@ def period_enrollments(period_id: int):
     enrollments = (
         StudentEnrollment.query.filter_by(class_period_id=period_id)
         .join(User, User.id == StudentEnrollment.student_id)
+        .options(contains_eager(StudentEnrollment.student))  # fill .student from the join
         .order_by(User.full_name.asc())
         .all()
     )
@@ -634,10 +773,8 @@ def period_enrollments(period_id: int):
 
 @bp.route("/periods/<int:period_id>/enrollments/add", methods=["POST"])
 @login_required
+@admin_required
 def period_enrollments_add(period_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
     p = db.session.get(ClassPeriod, period_id)
     if not p:
         flash("Period not found.", "warning")
@@ -650,11 +787,12 @@ def period_enrollments_add(period_id: int):
     if not student:
         flash("Student not found.", "warning")
         return redirect(url_for("admin.period_enrollments", period_id=period_id))
-    existing = StudentEnrollment.query.filter_by(student_id=student.id, class_period_id=period_id).first()
-    if existing:
-        existing.is_active = 1
-    else:
-        db.session.add(StudentEnrollment(student_id=student.id, class_period_id=period_id, is_active=1))
+    # re-activates an existing (student, period) row instead of inserting a duplicate
+    db.session.execute(
+        sqlite_insert(StudentEnrollment)
+        .values(student_id=student.id, class_period_id=period_id, is_active=1)
+        .on_conflict_do_update(index_elements=["student_id", "class_period_id"], set_={"is_active": 1})
+    )
     db.session.add(LogEntry(actor_id=current_user.id, action="enrollment_added", target_type="class_period", target_id=period_id, message=student_email))
     db.session.commit()
     flash("Enrollment added.", "success")
@@ -663,15 +801,14 @@ def period_enrollments_add(period_id: int):
 
 @bp.route("/periods/<int:period_id>/enrollments/<int:enr_id>/remove", methods=["POST"])
 @login_required
+@admin_required
 def period_enrollments_remove(period_id: int, enr_id: int):
-    redir = require_admin()
-    if redir:
-        return redir
-    e = db.session.get(StudentEnrollment, enr_id)
-    if not e or e.class_period_id != period_id:
+    result = db.session.execute(
+        delete(StudentEnrollment).where(StudentEnrollment.id == enr_id, StudentEnrollment.class_period_id == period_id)
+    )
+    if not result.rowcount:
         flash("Enrollment not found.", "warning")
         return redirect(url_for("admin.period_enrollments", period_id=period_id))
-    db.session.delete(e)
     db.session.add(LogEntry(actor_id=current_user.id, action="enrollment_removed", target_type="class_period", target_id=period_id, message=str(enr_id)))
     db.session.commit()
     flash("Enrollment removed.", "success")
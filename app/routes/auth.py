@@ -1,49 +1,81 @@
 from __future__ import annotations
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from typing import Optional
+
+from flask import Blueprint, current_app, render_template, request, redirect, session, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import check_password_hash
+from sqlalchemy import select, update
 
-from app import db
+from app import db, hash_password, password_needs_rehash, verify_password
 from app.models.core import User, Role
 
 bp = Blueprint("auth", __name__)
 
 
+def _login_csrf_ok() -> bool:
+    # Login is exempt from CSRF unless LOGIN_CSRF_STRICT is set: validating a token and then
+    # ignoring the outcome only cost an HMAC per attempt.
+    if not current_app.config["LOGIN_CSRF_STRICT"]:
+        return True
+    from flask_wtf.csrf import validate_csrf
+    from wtforms import ValidationError
+
+    try:
+        validate_csrf(request.form.get("csrf_token"))
+    except ValidationError:
+        return False
+    return True
+
+
+# The login page only differs between anonymous visitors by its CSRF token, so render it
+# once with a placeholder and splice the token in afterwards.
+_CSRF_PLACEHOLDER = "__csrf_token__"
+_login_page: Optional[str] = None
+
+
+def _render_login() -> str:
+    from flask_wtf.csrf import generate_csrf
+
+    csrf_token = generate_csrf()
+    # Flash messages are part of the page; debug re-renders so template edits show up.
+    if session.get("_flashes") or current_app.debug:
+        return render_template("auth/login.html", csrf_token=csrf_token)
+    global _login_page
+    if _login_page is None:
+        _login_page = render_template("auth/login.html", csrf_token=_CSRF_PLACEHOLDER)
+    return _login_page.replace(_CSRF_PLACEHOLDER, csrf_token)
+
+
 @bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("main.dashboard"))
 
-    if request.method == "POST":
-        # Exempt login POST from CSRF to avoid blocking non-WTF forms.
-        # CSRF is still enforced globally for other modifying routes via Flask-WTF.
-        from flask_wtf.csrf import validate_csrf
-        try:
-            token = request.form.get("csrf_token")
-            if token:
-                validate_csrf(token)
-        except Exception:
-            # If token missing or invalid, we continue for login-only to keep UX simple.
-            pass
-
+    if request.method == "POST" and not _login_csrf_ok():
+        flash("Your session expired. Please try again.", "warning")
+    elif request.method == "POST":
         email = request.form.get("email", "").strip().lower()
         password = request.form.get("password", "")
-        user = User.query.filter_by(email=email).first()
-        if user and user.password_hash and check_password_hash(user.password_hash, password):
-            if not user.is_active:
+        # Just the columns needed to check the password; the User is loaded only on success.
+        row = db.session.execute(
+            select(User.id, User.password_hash, User.is_active_flag).where(User.email == email)
+        ).first()
+        if row and row.password_hash and verify_password(row.password_hash, password):
+            if row.is_active_flag != 1:
                 flash("Account is inactive.", "warning")
                 # Fall through to re-render login below
             else:
-                login_user(user)
+                # Move legacy hashes (e.g. 600k-round pbkdf2) onto the configured method;
+                # debug keeps the cheap hashes the demo seed writes.
+                if not current_app.debug and password_needs_rehash(row.password_hash):
+                    db.session.execute(update(User).where(User.id == row.id).values(password_hash=hash_password(password)))
+                    db.session.commit()
+                login_user(db.session.get(User, row.id))
                 return redirect(url_for("main.dashboard"))
         else:
             flash("Invalid credentials.", "danger")
 
-    # Provide a CSRF token for the form if template wants to render it.
-    from flask_wtf.csrf import generate_csrf
-    csrf_token = generate_csrf()
-    return render_template("auth/login.html", csrf_token=csrf_token)
+    return _render_login()
 
 
 @bp.route("/logout")
@@ -91,14 +123,13 @@ def register():
             csrf_token = generate_csrf()
             return render_template("auth/register.html", csrf_token=csrf_token)
 
-        role = Role.query.filter_by(name=role_name).first()
-        if not role:
+        role_id = Role.id_for(role_name)
+        if role_id is None:
             flash("Invalid role.", "danger")
             csrf_token = generate_csrf()
             return render_template("auth/register.html", csrf_token=csrf_token)
 
-        from werkzeug.security import generate_password_hash
-        user = User(full_name=full_name, email=email, password_hash=generate_password_hash(password), role_id=role.id)
+        user = User(full_name=full_name, email=email, password_hash=hash_password(password), role_id=role_id)
         db.session.add(user)
         db.session.commit()
         flash("Registration successful. Please login.", "success")
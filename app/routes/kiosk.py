@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-from datetime import datetime
+import hashlib
 
-from flask import Blueprint, render_template, jsonify, request, make_response
-from app import db
-from app.models.core import Pass, PassState, PassAssignment, Destination, Kiosk
+import orjson
+from flask import Blueprint, current_app, render_template, request, make_response
+from app import read_session
+from app.models.core import KIOSK_BINDING_OPTIONS, Kiosk
+from app.models.queries import KIOSK_ACTIVE_PASSES, KIOSK_BOARD_VERSION
 
 bp = Blueprint("kiosk", __name__)
 
@@ -16,7 +18,8 @@ def view():
     kiosk = None
     banner = None
     if token:
-        kiosk = Kiosk.query.filter_by(token=token, is_active=1).first()
+        # The banner reads the bound period, its teacher and the bound teacher: one SELECT
+        kiosk = Kiosk.query.options(*KIOSK_BINDING_OPTIONS).filter_by(token=token, is_active=1).first()
         if kiosk:
             if kiosk.class_period:
                 banner = f"Kiosk: {kiosk.name} (Room {kiosk.room or '-'}) • Class: {kiosk.class_period.name} • Teacher: {kiosk.class_period.teacher.full_name}"
@@ -32,29 +35,27 @@ def view():
 @bp.route("/data")
 def data():
     # Provide JSON for auto-refresh
-    now = datetime.utcnow()
-    items = (
-        db.session.query(Pass, Destination.name)
-        .join(Destination, Pass.destination_id == Destination.id)
-        .filter(Pass.state == PassState.ACTIVE)
-        .order_by(Pass.issued_at.desc())
-        .limit(100)
-        .all()
-    )
-    def to_row(p: Pass, dest_name: str):
-        remaining = 0
-        issued_iso = p.issued_at.isoformat() + "Z" if p.issued_at else None
-        expires_iso = None
-        if p.expires_at:
-            expires_iso = p.expires_at.isoformat() + "Z"
-            remaining = max(0, int((p.expires_at - now).total_seconds()))
-        return {
-            "id": p.id,
-            "student": p.student.full_name,
-            "destination": dest_name,
-            "issued_at": issued_iso,
-            "expires_at": expires_iso,
-            "remaining_seconds": remaining,
-            "staff": ", ".join({a.teacher.full_name for a in p.assignments}) if p.assignments else "",
-        }
-    return jsonify([to_row(p, dname) for (p, dname) in items])
+    # Conditional GET: idle polls revalidate against a one-row aggregate and get a 304.
+    with read_session() as session:
+        version = session.execute(KIOSK_BOARD_VERSION).one()
+        # The layout name is part of the tag so a browser never revalidates a body cached in
+        # an older payload shape.
+        etag = hashlib.blake2s(repr(("columns", *version)).encode(), digest_size=16).hexdigest()
+        if etag in request.if_none_match:
+            resp = current_app.response_class(status=304)
+            resp.set_etag(etag)
+            return resp
+        result = session.execute(KIOSK_ACTIVE_PASSES)
+        keys = list(result.keys())
+        rows = result.all()
+
+    # Column-oriented: {"id": [...], "student": [...], ...}, one list per field instead of a
+    # dict per pass; app.js zips them back up. No remaining_seconds: the kiosk counts down
+    # from expires_at against its own clock.
+    columns = dict(zip(keys, zip(*rows))) if rows else dict.fromkeys(keys, ())
+    # Stored datetimes are naive UTC; orjson writes them as ISO 8601 with a "Z" suffix.
+    body = orjson.dumps(columns, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+    resp = current_app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True  # always revalidate; the ETag makes that cheap
+    return resp
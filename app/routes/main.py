@@ -1,16 +1,40 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
+from time import monotonic
+from typing import Optional
 
 from flask import Blueprint, render_template, redirect, url_for
 from flask_login import login_required, current_user
+from sqlalchemy import func, select
 
 from app import db
-from app.models.core import Role, User, Destination, Pass, PassState, PassAssignment, LogEntry
+from app.models.core import Role, User, Destination, Pass, PassAssignment, LogEntry, PASS_LIST_OPTIONS, STUDENT_PASS_LIST_OPTIONS, list_options
 
 bp = Blueprint("main", __name__)
 
 
+# (expires_at monotonic, (users, destinations)) for the admin dashboard. Same idea as
+# Pass.active_count(): a few seconds of staleness on a landing page is fine.
+ADMIN_TOTALS_TTL = 10.0
+_admin_totals_cache: Optional[tuple[float, tuple[int, int]]] = None
+
+
+def _admin_totals() -> tuple[int, int]:
+    global _admin_totals_cache
+    now = monotonic()
+    if _admin_totals_cache is None or now >= _admin_totals_cache[0]:
+        # One round trip for both totals
+        totals = db.session.execute(
+            select(
+                select(func.count()).select_from(User).scalar_subquery(),
+                select(func.count()).select_from(Destination).scalar_subquery(),
+            )
+        ).one()
+        _admin_totals_cache = (now + ADMIN_TOTALS_TTL, tuple(totals))
+    return _admin_totals_cache[1]
+
+
 @bp.route("/")
 def index():
     if current_user.is_authenticated:
@@ -23,9 +47,8 @@ def index():
 def dashboard():
     # Role-aware landing
     if current_user.role.name == "Admin":
-        users_count = User.query.count()
-        destinations_count = Destination.query.count()
-        active_passes = Pass.query.filter_by(state=PassState.ACTIVE).count()
+        users_count, destinations_count = _admin_totals()
+        active_passes = Pass.active_count()
         return render_template(
             "admin/dashboard.html",
             users_count=users_count,
@@ -35,6 +58,7 @@ def dashboard():
     elif current_user.role.name == "Teacher":
         my_passes = (
             db.session.query(Pass)
+            .options(*list_options(PASS_LIST_OPTIONS))
             .join(PassAssignment, PassAssignment.pass_id == Pass.id)
             .filter(PassAssignment.teacher_id == current_user.id)
             .order_by(Pass.issued_at.desc())
@@ -44,7 +68,8 @@ def dashboard():
         return render_template("teacher/dashboard.html", my_passes=my_passes)
     else:
         student_passes = (
-            Pass.query.filter_by(student_id=current_user.id)
+            Pass.query.options(*list_options(STUDENT_PASS_LIST_OPTIONS))
+            .filter_by(student_id=current_user.id)
             .order_by(Pass.issued_at.desc())
             .limit(20)
             .all()
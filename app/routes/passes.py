@@ -1,12 +1,21 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
+from time import monotonic
+from typing import Optional
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+import orjson
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.orm import aliased, contains_eager, joinedload
 
 from app import db
-from app.models.core import User, Destination, Pass, PassAssignment, PassState, Override, LogEntry, Setting, ClassPeriod, StudentEnrollment, Role, Kiosk
+from app.models.core import (
+    User, Destination, Pass, PassAssignment, PassState, Override, LogEntry, Setting, ClassPeriod, StudentEnrollment, Role, Kiosk,
+    KIOSK_BINDING_OPTIONS, PASS_LIST_OPTIONS, STUDENT_PASS_LIST_OPTIONS, list_options, pass_write_count,
+)
+from app.models.queries import ANY_PASS_DUE, EXPIRE_DUE_PASSES
 
 bp = Blueprint("passes", __name__)
 
@@ -24,33 +33,61 @@ def is_student() -> bool:
 
 
 def get_setting(key: str, default: str) -> str:
-    s = Setting.query.filter_by(key=key, scope="global").first()
-    return s.value if s else default
+    return Setting.get_cached(key, default=default)
+
+
+def sole_enrolled_teacher_period() -> Optional[ClassPeriod]:
+    """The current student's class period if all their active enrollments share one teacher.
+
+    Only ACTIVE enrollments in ACTIVE periods of ACTIVE teachers (Teacher role and
+    is_active_flag=1) count. The teacher check is one aggregate row (min == max teacher_id);
+    the period itself, with its teacher, is only loaded when there is a match.
+    """
+    first_id, min_teacher, max_teacher = db.session.execute(
+        select(func.min(ClassPeriod.id), func.min(ClassPeriod.teacher_id), func.max(ClassPeriod.teacher_id))
+        .join(StudentEnrollment, StudentEnrollment.class_period_id == ClassPeriod.id)
+        .join(User, User.id == ClassPeriod.teacher_id)
+        .join(Role, Role.id == User.role_id)
+        .where(
+            StudentEnrollment.student_id == current_user.id,
+            StudentEnrollment.is_active == 1,
+            ClassPeriod.is_active == 1,
+            Role.name == "Teacher",
+            User.is_active,
+        )
+    ).one()
+    if first_id is None or min_teacher != max_teacher:
+        return None
+    return db.session.get(ClassPeriod, first_id, options=[joinedload(ClassPeriod.teacher)])
+
+
+def assigned_to_me():
+    """WHERE clause limiting passes to the current teacher's; usable in UPDATEs, which can't join."""
+    return Pass.id.in_(select(PassAssignment.pass_id).where(PassAssignment.teacher_id == current_user.id))
+
+
+# Upper bound on ids taken from one batch form; a period's board never comes close.
+MAX_BATCH_IDS = 500
+
+
+def selected_pass_ids() -> list[int]:
+    """Checked pass ids from a batch form as ints, so IN (...) binds integers against the PK."""
+    return [int(x) for x in request.form.getlist("pass_ids") if x.isdigit()][:MAX_BATCH_IDS]
 
 
 @bp.route("/")
 @login_required
 def index():
     if is_teacher() or is_admin():
-        # Auto-expire any passes whose time has elapsed
+        # Auto-expire any passes whose time has elapsed; the UPDATE (and its write
+        # transaction) only runs when the read-side check finds something due.
         now = datetime.utcnow()
-        stale = (
-            db.session.query(Pass)
-            .filter(Pass.state == PassState.ACTIVE, Pass.expires_at != None, Pass.expires_at <= now)  # noqa: E711
-            .all()
-        )
-        for p in stale:
-            p.state = PassState.EXPIRED
-            db.session.add(
-                LogEntry(
-                    actor_id=current_user.id if current_user.is_authenticated else None,
-                    action="pass_auto_expired",
-                    target_type="pass",
-                    target_id=p.id,
-                    message="expired by system",
-                )
+        if db.session.scalar(ANY_PASS_DUE, {"now": now}):
+            expired_ids = db.session.scalars(EXPIRE_DUE_PASSES, {"now": now}).all()
+            LogEntry.bulk_log(
+                current_user.id if current_user.is_authenticated else None,
+                [("pass_auto_expired", "pass", pass_id, "expired by system") for pass_id in expired_ids],
             )
-        if stale:
             db.session.commit()
 
         query_pending = db.session.query(Pass).filter(Pass.state == PassState.PENDING)
@@ -67,11 +104,17 @@ def index():
                 .filter(PassAssignment.teacher_id == current_user.id)
             )
 
-        pending = query_pending.order_by(Pass.id.desc()).limit(100).all()
-        active = query_active.order_by(Pass.issued_at.desc()).limit(100).all()
+        pending = query_pending.options(*list_options(PASS_LIST_OPTIONS)).order_by(Pass.id.desc()).limit(100).all()
+        active = query_active.options(*list_options(PASS_LIST_OPTIONS)).order_by(Pass.issued_at.desc()).limit(100).all()
         return render_template("passes/index.html", passes=pending + active)
     else:
-        mine = Pass.query.filter_by(student_id=current_user.id).order_by(Pass.issued_at.desc()).limit(50).all()
+        mine = (
+            Pass.query.options(*list_options(STUDENT_PASS_LIST_OPTIONS))
+            .filter_by(student_id=current_user.id)
+            .order_by(Pass.issued_at.desc())
+            .limit(50)
+            .all()
+        )
         return render_template("passes/mine.html", passes=mine)
 
 
@@ -91,11 +134,15 @@ def request_pass():
     is_kiosk = False
 
     # Resolve kiosk auto-assign: prefer kiosk token binding over legacy global settings
+    kiosk = None
     kiosk_cp_id = None
     kiosk_teacher_id = None
     kiosk_token = request.args.get("token") or request.cookies.get("kiosk_token")
     if kiosk_token:
-        kiosk = Kiosk.query.filter_by(token=kiosk_token, is_active=1).first()
+        # Bound period, its teacher and a bound teacher arrive with the kiosk row.
+        kiosk = db.session.execute(
+            select(Kiosk).options(*KIOSK_BINDING_OPTIONS).where(Kiosk.token == kiosk_token, Kiosk.is_active == 1)
+        ).scalar_one_or_none()
         if kiosk:
             is_kiosk = True
             if kiosk.class_period_id:
@@ -113,11 +160,13 @@ def request_pass():
     #     if s_t and s_t.value and s_t.value.isdigit():
     #         kiosk_teacher_id = int(s_t.value)
 
-    # Student enrollments (for class period selection)
+    # Student enrollments (for class period selection); the picker labels each with its
+    # period and teacher name, so load both with the enrollments.
     enrollments = (
         db.session.query(StudentEnrollment)
         .filter(StudentEnrollment.student_id == current_user.id, StudentEnrollment.is_active == 1)
         .join(ClassPeriod, ClassPeriod.id == StudentEnrollment.class_period_id)
+        .options(contains_eager(StudentEnrollment.class_period).joinedload(ClassPeriod.teacher))
         .order_by(ClassPeriod.name.asc())
         .all()
     )
@@ -129,40 +178,24 @@ def request_pass():
     # Determine target teacher:
     # 1) Prefer kiosk class-period binding if present.
     if kiosk_cp_id:
-        selected_cp = db.session.get(ClassPeriod, kiosk_cp_id)
+        selected_cp = kiosk.class_period
         if selected_cp:
             target_teacher_id = selected_cp.teacher_id
             auto_assigned_note = f"Auto-assigned to {selected_cp.teacher.full_name} ({selected_cp.name})"
     # 2) Else if kiosk is bound to a teacher, use that.
     elif kiosk_teacher_id:
-        t = db.session.get(User, kiosk_teacher_id)
+        t = kiosk.teacher
         if t:
             target_teacher_id = t.id
             auto_assigned_note = f"Auto-assigned to {t.full_name}"
     # 3) Else infer teacher from the student's active enrollments if exactly one teacher is associated.
     if not target_teacher_id:
-        # Only consider ACTIVE enrollments for ACTIVE teachers (Teacher role and is_active_flag=1)
-        enrolled_periods = (
-            db.session.query(ClassPeriod)
-            .join(StudentEnrollment, StudentEnrollment.class_period_id == ClassPeriod.id)
-            .join(User, User.id == ClassPeriod.teacher_id)
-            .join(Role, Role.id == User.role_id)
-            .filter(
-                StudentEnrollment.student_id == current_user.id,
-                StudentEnrollment.is_active == 1,
-                ClassPeriod.is_active == 1,
-                Role.name == "Teacher",
-                User.is_active_flag == 1,
-            )
-            .all()
-        )
-        unique_teachers = {p.teacher_id for p in enrolled_periods}
-        if len(unique_teachers) == 1:
-            target_teacher_id = next(iter(unique_teachers))
-            # Also pick a representative period for time window check/note
-            if enrolled_periods:
-                selected_cp = enrolled_periods[0]
-                auto_assigned_note = f"Auto-assigned from enrollment: {selected_cp.teacher.full_name} ({selected_cp.name})"
+        sole_cp = sole_enrolled_teacher_period()
+        if sole_cp:
+            target_teacher_id = sole_cp.teacher_id
+            # Also the representative period for time window check/note
+            selected_cp = sole_cp
+            auto_assigned_note = f"Auto-assigned from enrollment: {selected_cp.teacher.full_name} ({selected_cp.name})"
 
     if request.method == "POST":
         dest_id = int(request.form.get("destination_id", "0"))
@@ -182,33 +215,13 @@ def request_pass():
                     cp_id = int(sel_cp_id)
                 except ValueError:
                     cp_id = 0
-                if cp_id:
-                    cp = db.session.get(ClassPeriod, cp_id)
-                    # validate student is enrolled in this class
-                    if cp and StudentEnrollment.query.filter_by(student_id=current_user.id, class_period_id=cp.id, is_active=1).first():
-                        selected_cp = cp
-                        target_teacher_id = cp.teacher_id
-            # If still not resolved and there is exactly one enrolled teacher, auto-assign that teacher
-            if not target_teacher_id:
-                enrolled_periods = (
-                    db.session.query(ClassPeriod)
-                    .join(StudentEnrollment, StudentEnrollment.class_period_id == ClassPeriod.id)
-                    .join(User, User.id == ClassPeriod.teacher_id)
-                    .join(Role, Role.id == User.role_id)
-                    .filter(
-                        StudentEnrollment.student_id == current_user.id,
-                        StudentEnrollment.is_active == 1,
-                        ClassPeriod.is_active == 1,
-                        Role.name == "Teacher",
-                        User.is_active_flag == 1,
-                    )
-                    .all()
-                )
-                unique_teachers = {p.teacher_id for p in enrolled_periods}
-                if len(unique_teachers) == 1:
-                    target_teacher_id = next(iter(unique_teachers))
-                    if enrolled_periods:
-                        selected_cp = enrolled_periods[0]
+                # validate student is enrolled in this class, against the enrollments loaded above
+                cp = next((e.class_period for e in enrollments if e.class_period_id == cp_id), None)
+                if cp:
+                    selected_cp = cp
+                    target_teacher_id = cp.teacher_id
+            # A sole enrolled teacher was already picked above, before the form was read;
+            # target_teacher_id is only still empty here if there wasn't one.
 
         if not target_teacher_id:
             # If there are multiple active enrolled periods, force selection and display options.
@@ -242,10 +255,26 @@ def request_pass():
 @bp.route("/mine")
 @login_required
 def mine():
-    passes = Pass.query.filter_by(student_id=current_user.id).order_by(Pass.issued_at.desc()).limit(50).all()
+    passes = (
+        Pass.query.options(*list_options(STUDENT_PASS_LIST_OPTIONS))
+        .filter_by(student_id=current_user.id)
+        .order_by(Pass.issued_at.desc())
+        .limit(50)
+        .all()
+    )
     return render_template("passes/mine.html", passes=passes)
 
 
+# Rows per list on the my_period page.
+MY_PERIOD_PAGE_SIZE = 50
+
+
+def _page(query) -> tuple[list, bool]:
+    """First MY_PERIOD_PAGE_SIZE rows of an ordered query, and whether more follow."""
+    rows = query.limit(MY_PERIOD_PAGE_SIZE + 1).all()
+    return rows[:MY_PERIOD_PAGE_SIZE], len(rows) > MY_PERIOD_PAGE_SIZE
+
+
 @bp.route("/my-period", methods=["GET"])
 @login_required
 def my_period():
@@ -274,20 +303,44 @@ def my_period():
 
     # Further filter by period (if provided) to passes requested by students enrolled in that class
     if period:
-        student_ids = [e.student_id for e in StudentEnrollment.query.filter_by(class_period_id=period.id, is_active=1).all()]
+        student_ids = db.session.scalars(
+            select(StudentEnrollment.student_id).where(StudentEnrollment.class_period_id == period.id, StudentEnrollment.is_active == 1)
+        ).all()
         if student_ids:
             base_pending = base_pending.filter(Pass.student_id.in_(student_ids))
             base_active = base_active.filter(Pass.student_id.in_(student_ids))
 
-    pending = base_pending.order_by(Pass.id.desc()).all()
-    active = base_active.order_by(Pass.issued_at.desc().nullslast()).all()
+    # Keyset pages: ?before_id= continues the pending list below that id, and
+    # ?active_before_id= continues the active list after that pass's (issued_at, id).
+    before_id = request.args.get("before_id", type=int)
+    if before_id:
+        base_pending = base_pending.filter(Pass.id < before_id)
+    active_before_id = request.args.get("active_before_id", type=int)
+    if active_before_id:
+        cursor = aliased(Pass)
+        cursor_issued = select(cursor.issued_at).where(cursor.id == active_before_id).scalar_subquery()
+        base_active = base_active.filter(tuple_(Pass.issued_at, Pass.id) < tuple_(cursor_issued, active_before_id))
+
+    pending, more_pending = _page(base_pending.options(*list_options(PASS_LIST_OPTIONS)).order_by(Pass.id.desc()))
+    # ACTIVE passes always have issued_at, so this walks ix_passes_state_issued; no NULLS LAST needed.
+    active, more_active = _page(
+        base_active.options(*list_options(PASS_LIST_OPTIONS)).order_by(Pass.issued_at.desc(), Pass.id.desc())
+    )
 
     # Teacher's available periods for filter
     teacher_periods = []
     if is_teacher():
         teacher_periods = ClassPeriod.query.filter_by(teacher_id=current_user.id, is_active=1).order_by(ClassPeriod.name).all()
 
-    return render_template("passes/my_period.html", pending=pending, active=active, teacher_periods=teacher_periods, selected_period=period)
+    return render_template(
+        "passes/my_period.html",
+        pending=pending,
+        active=active,
+        more_pending=more_pending,
+        more_active=more_active,
+        teacher_periods=teacher_periods,
+        selected_period=period,
+    )
 
 
 @bp.route("/my-period/approve_all", methods=["POST"])
@@ -302,24 +355,38 @@ def my_period_approve_all():
     period = None
     if period_id and period_id.isdigit():
         period = db.session.get(ClassPeriod, int(period_id))
-    q = db.session.query(Pass).filter(Pass.state == PassState.PENDING)
+    # (id, timer minutes) per pending pass; each gets its own destination's default.
+    q = (
+        select(Pass.id, func.coalesce(Destination.default_minutes, 5))
+        .outerjoin(Destination, Destination.id == Pass.destination_id)
+        .where(Pass.state == PassState.PENDING)
+    )
     if is_teacher():
-        q = q.join(PassAssignment, PassAssignment.pass_id == Pass.id).filter(PassAssignment.teacher_id == current_user.id)
+        q = q.where(assigned_to_me())
     if period:
-        student_ids = [e.student_id for e in StudentEnrollment.query.filter_by(class_period_id=period.id, is_active=1).all()]
+        student_ids = db.session.scalars(
+            select(StudentEnrollment.student_id).where(StudentEnrollment.class_period_id == period.id, StudentEnrollment.is_active == 1)
+        ).all()
         if student_ids:
-            q = q.filter(Pass.student_id.in_(student_ids))
+            q = q.where(Pass.student_id.in_(student_ids))
+    # Passes sharing a timer length share expires_at, so each distinct length is one
+    # UPDATE ... WHERE id IN (...); the PENDING guard skips passes changed since the SELECT.
+    by_minutes: dict[int, list[int]] = {}
+    for pass_id, minutes in db.session.execute(q):
+        by_minutes.setdefault(minutes, []).append(pass_id)
     now = datetime.utcnow()
-    updated = 0
-    for p in q.all():
-        dest = db.session.get(Destination, p.destination_id)
-        minutes = dest.default_minutes if dest else 5
-        p.issued_at = now
-        p.expires_at = now + timedelta(minutes=minutes)
-        p.state = PassState.ACTIVE
-        db.session.add(LogEntry(actor_id=current_user.id, action="pass_approved", target_type="pass", target_id=p.id, message="batch"))
-        updated += 1
+    approved: list[int] = []
+    for minutes, pass_ids in by_minutes.items():
+        approved += db.session.scalars(
+            update(Pass)
+            .where(Pass.id.in_(pass_ids), Pass.state == PassState.PENDING)
+            .values(state=PassState.ACTIVE, issued_at=now, expires_at=now + timedelta(minutes=minutes))
+            .returning(Pass.id),
+            execution_options={"synchronize_session": False},
+        ).all()
+    updated = len(approved)
     if updated:
+        LogEntry.bulk_log(current_user.id, [("pass_approved", "pass", pass_id, "batch") for pass_id in approved])
         db.session.commit()
         flash(f"Approved {updated} pending pass(es).", "success")
     else:
@@ -333,19 +400,19 @@ def my_period_deny_selected():
     if not is_teacher() and not is_admin():
         flash("Teacher/Admin access required.", "danger")
         return redirect(url_for("passes.my_period"))
-    ids = request.form.getlist("pass_ids")
+    ids = selected_pass_ids()
     if not ids:
         flash("No passes selected.", "info")
         return redirect(url_for("passes.my_period"))
-    q = db.session.query(Pass).filter(Pass.id.in_(ids), Pass.state == PassState.PENDING)
+    stmt = update(Pass).where(Pass.id.in_(ids), Pass.state == PassState.PENDING)
     if is_teacher():
-        q = q.join(PassAssignment, PassAssignment.pass_id == Pass.id).filter(PassAssignment.teacher_id == current_user.id)
-    count = 0
-    for p in q.all():
-        p.state = PassState.DENIED
-        db.session.add(LogEntry(actor_id=current_user.id, action="pass_denied", target_type="pass", target_id=p.id, message="batch"))
-        count += 1
+        stmt = stmt.where(assigned_to_me())
+    denied = db.session.scalars(
+        stmt.values(state=PassState.DENIED).returning(Pass.id), execution_options={"synchronize_session": False}
+    ).all()
+    count = len(denied)
     if count:
+        LogEntry.bulk_log(current_user.id, [("pass_denied", "pass", pass_id, "batch") for pass_id in denied])
         db.session.commit()
         flash(f"Denied {count} pass(es).", "success")
     else:
@@ -359,19 +426,19 @@ def my_period_cancel_selected():
     if not is_teacher() and not is_admin():
         flash("Teacher/Admin access required.", "danger")
         return redirect(url_for("passes.my_period"))
-    ids = request.form.getlist("pass_ids")
+    ids = selected_pass_ids()
     if not ids:
         flash("No passes selected.", "info")
         return redirect(url_for("passes.my_period"))
-    q = db.session.query(Pass).filter(Pass.id.in_(ids), Pass.state == PassState.ACTIVE)
+    stmt = update(Pass).where(Pass.id.in_(ids), Pass.state == PassState.ACTIVE)
     if is_teacher():
-        q = q.join(PassAssignment, PassAssignment.pass_id == Pass.id).filter(PassAssignment.teacher_id == current_user.id)
-    count = 0
-    for p in q.all():
-        p.state = PassState.CANCELLED
-        db.session.add(LogEntry(actor_id=current_user.id, action="pass_cancelled", target_type="pass", target_id=p.id, message="batch"))
-        count += 1
+        stmt = stmt.where(assigned_to_me())
+    cancelled = db.session.scalars(
+        stmt.values(state=PassState.CANCELLED).returning(Pass.id), execution_options={"synchronize_session": False}
+    ).all()
+    count = len(cancelled)
     if count:
+        LogEntry.bulk_log(current_user.id, [("pass_cancelled", "pass", pass_id, "batch") for pass_id in cancelled])
         db.session.commit()
         flash(f"Cancelled {count} pass(es).", "success")
     else:
@@ -385,26 +452,35 @@ def my_period_override_selected():
     if not is_teacher() and not is_admin():
         flash("Teacher/Admin access required.", "danger")
         return redirect(url_for("passes.my_period"))
-    ids = request.form.getlist("pass_ids")
+    ids = selected_pass_ids()
     add_minutes = int(request.form.get("add_minutes", "0"))
     reason = request.form.get("reason", "").strip() or None
     if not ids or add_minutes <= 0:
         flash("Select passes and specify minutes > 0.", "warning")
         return redirect(url_for("passes.my_period"))
-    q = db.session.query(Pass).filter(Pass.id.in_(ids), Pass.state == PassState.ACTIVE)
+    q = select(Pass.id, Pass.expires_at).where(Pass.id.in_(ids), Pass.state == PassState.ACTIVE, Pass.expires_at.is_not(None))
     if is_teacher():
-        q = q.join(PassAssignment, PassAssignment.pass_id == Pass.id).filter(PassAssignment.teacher_id == current_user.id)
-    count = 0
-    for p in q.all():
-        if not p.expires_at:
-            continue
-        prev = p.expires_at
-        p.expires_at = p.expires_at + timedelta(minutes=add_minutes)
-        db.session.add(Override(pass_id=p.id, performed_by_id=current_user.id, previous_expires_at=prev, new_expires_at=p.expires_at, reason=reason))
-        action = "override_admin" if is_admin() else "override_teacher"
-        db.session.add(LogEntry(actor_id=current_user.id, action=action, target_type="pass", target_id=p.id, message=reason))
-        count += 1
+        q = q.where(assigned_to_me())
+    action = "override_admin" if is_admin() else "override_teacher"
+    delta = timedelta(minutes=add_minutes)
+    rows = db.session.execute(q).all()
+    count = len(rows)
     if count:
+        db.session.execute(update(Pass), [{"id": pass_id, "expires_at": prev + delta} for pass_id, prev in rows])
+        db.session.execute(
+            insert(Override),
+            [
+                {
+                    "pass_id": pass_id,
+                    "performed_by_id": current_user.id,
+                    "previous_expires_at": prev,
+                    "new_expires_at": prev + delta,
+                    "reason": reason,
+                }
+                for pass_id, prev in rows
+            ],
+        )
+        LogEntry.bulk_log(current_user.id, [(action, "pass", pass_id, reason) for pass_id, _ in rows])
         db.session.commit()
         flash(f"Overridden {count} pass(es) by +{add_minutes} minutes.", "success")
     else:
@@ -412,15 +488,38 @@ def my_period_override_selected():
     return redirect(url_for("passes.my_period"))
 
 
+# /my-period/stats is polled by every open teacher dashboard, so pending counts are
+# cached per teacher (None for admins, who see all) for STATS_TTL seconds. Any pass
+# write made through this process drops them early, like the admin metrics cache.
+STATS_TTL = 5.0
+_pending_counts: dict[Optional[int], tuple[float, int, int]] = {}  # key -> (expires, pass_write_count, count)
+
+
+def _pending_count(teacher_id: Optional[int]) -> int:
+    now = monotonic()
+    writes = pass_write_count()
+    cached = _pending_counts.get(teacher_id)
+    if cached is None or now >= cached[0] or writes != cached[1]:
+        stmt = select(func.count()).select_from(Pass).where(Pass.state == PassState.PENDING)
+        if teacher_id is not None:
+            stmt = stmt.where(Pass.id.in_(select(PassAssignment.pass_id).where(PassAssignment.teacher_id == teacher_id)))
+        cached = _pending_counts[teacher_id] = (now + STATS_TTL, writes, db.session.scalar(stmt))
+    return cached[2]
+
+
+def _json(payload: dict):
+    # orjson, as for kiosk /data: naive UTC datetimes come out as ISO 8601 with a "Z" suffix.
+    body = orjson.dumps(payload, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+    return current_app.response_class(body, mimetype="application/json")
+
+
 @bp.route("/my-period/stats", methods=["GET"])
 @login_required
 def my_period_stats():
     if not is_teacher() and not is_admin():
-        return jsonify({"pending_count": 0})
-    q = db.session.query(Pass).filter(Pass.state == PassState.PENDING)
-    if is_teacher():
-        q = q.join(PassAssignment, PassAssignment.pass_id == Pass.id).filter(PassAssignment.teacher_id == current_user.id)
-    return jsonify({"pending_count": q.count(), "ts": datetime.utcnow().isoformat() + "Z"})
+        return _json({"pending_count": 0})
+    count = _pending_count(current_user.id if is_teacher() else None)
+    return _json({"pending_count": count, "ts": datetime.utcnow()})
 
 
 @bp.route("/approve/<int:pass_id>", methods=["POST"])
@@ -435,9 +534,9 @@ def approve(pass_id: int):
         flash("Pass not found or not in approvable state.", "warning")
         return redirect(url_for("passes.index"))
 
-    # Enforcement settings
+    # Enforcement settings; with the window check off (the default) none of the period
+    # lookups below run.
     enforce_window = (get_setting("enforce_period_time_window", "false") == "true")
-    allow_outside = (get_setting("allow_teacher_approval_outside_period", "true") == "true")
 
     # If pending, evaluate optional time window using any linked class period (via teacher).
     selected_cp = None
@@ -445,8 +544,10 @@ def approve(pass_id: int):
         # Heuristic: pick a class period for the approving teacher where the student is enrolled.
         if is_teacher():
             # teacher's periods
-            t_periods = ClassPeriod.query.filter_by(teacher_id=current_user.id, is_active=1).all()
-            if t_periods:
+            has_periods = db.session.scalar(
+                select(select(ClassPeriod.id).where(ClassPeriod.teacher_id == current_user.id, ClassPeriod.is_active == 1).exists())
+            )
+            if has_periods:
                 student_period = (
                     db.session.query(ClassPeriod)
                     .join(StudentEnrollment, StudentEnrollment.class_period_id == ClassPeriod.id)
@@ -471,7 +572,7 @@ def approve(pass_id: int):
                 )
 
         if selected_cp and not selected_cp.is_now_in_window(datetime.utcnow()):
-            if not allow_outside:
+            if get_setting("allow_teacher_approval_outside_period", "true") != "true":
                 flash("Approval blocked: outside class period time window.", "danger")
                 return redirect(url_for("passes.index"))
             else:
@@ -487,7 +588,9 @@ def approve(pass_id: int):
         p.state = PassState.ACTIVE
 
     # Assign teacher (track staff)
-    assigned = PassAssignment.query.filter_by(pass_id=p.id, teacher_id=current_user.id).first()
+    assigned = db.session.scalar(
+        select(select(PassAssignment.id).where(PassAssignment.pass_id == p.id, PassAssignment.teacher_id == current_user.id).exists())
+    )
     if not assigned:
         db.session.add(PassAssignment(pass_id=p.id, teacher_id=current_user.id))
 
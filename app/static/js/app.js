@@ -66,7 +66,16 @@
     if (!kioskTableBody) return; // not on kiosk page
     fetch("/kiosk/data")
       .then(r => r.json())
-      .then(rows => {
+      .then(cols => {
+        // /kiosk/data is column-oriented (one array per field); rebuild one object per pass
+        const rows = cols.id.map((id, i) => ({
+          id: id,
+          student: cols.student[i],
+          destination: cols.destination[i],
+          issued_at: cols.issued_at[i],
+          expires_at: cols.expires_at[i],
+          staff: cols.staff[i],
+        }));
         const prevIds = new Set(Array.from(kioskTableBody.querySelectorAll("tr")).map(tr => tr.dataset.id));
         kioskTableBody.innerHTML = "";
         rows.forEach(r => {
@@ -95,6 +104,54 @@
       })
       .catch(() => { /* ignore */ });
   }
+  // Admin user rows: submit toggle/reset in the background and patch the row in place.
+  // The server answers XHR submits with JSON ({message, is_active?}) and a 4xx status on
+  // failure; redirects (e.g. an expired login) reload the page instead of resubmitting.
+  function showRowMessage(form, text, ok) {
+    const cell = form.closest("td");
+    let msg = cell.querySelector(".xhr-msg");
+    if (!msg) {
+      msg = document.createElement("div");
+      msg.className = "xhr-msg small";
+      cell.appendChild(msg);
+    }
+    msg.textContent = text;
+    msg.classList.toggle("text-success", ok);
+    msg.classList.toggle("text-danger", !ok);
+  }
+
+  function patchToggledRow(form, nowActive) {
+    const row = form.closest("tr");
+    const badge = row.querySelector(".badge");
+    const btn = form.querySelector("button");
+    badge.textContent = nowActive ? "Active" : "Inactive";
+    badge.className = "badge " + (nowActive ? "text-bg-success" : "text-bg-secondary");
+    btn.textContent = nowActive ? "Deactivate" : "Activate";
+    btn.className = "btn btn-sm " + (nowActive ? "btn-outline-warning" : "btn-outline-success");
+  }
+
+  document.querySelectorAll("form[data-xhr]").forEach(function (form) {
+    form.addEventListener("submit", function (ev) {
+      ev.preventDefault();
+      fetch(form.action, {
+        method: "POST",
+        body: new FormData(form),
+        headers: { "X-Requested-With": "XMLHttpRequest" },
+        redirect: "manual",
+      })
+        .then(r => {
+          if (r.type === "opaqueredirect") return window.location.reload();
+          return r.json().then(data => {
+            showRowMessage(form, data.message, r.ok);
+            if (!r.ok) return;
+            if (form.dataset.xhr === "toggle") patchToggledRow(form, data.is_active);
+            else form.reset();
+          });
+        })
+        .catch(() => showRowMessage(form, "Request failed; reload and try again.", false));
+    });
+  });
+
   // Poll every 10s by default, can be adjusted by settings page value via data attribute if needed
   setInterval(kioskRefresh, 10000);
   kioskRefresh();
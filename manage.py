@@ -6,18 +6,12 @@ from app.models.seed import seed_data
 app = create_app()
 
 
-@app.cli.command("init-db")
-def init_db():
-    """Create all tables."""
-    with app.app_context():
-        db.create_all()
-        click.echo("Database initialized.")
-
-
 @app.cli.command("drop-db")
 def drop_db():
-    """Drop all tables."""
+    """Drop all tables, including the logs_fts index that db.metadata doesn't know about."""
     with app.app_context():
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("DROP TABLE IF EXISTS logs_fts")
         db.drop_all()
         click.echo("Database dropped.")
 